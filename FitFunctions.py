@@ -20,7 +20,51 @@ class Functions:
     def Gauss(x, offset, x0, height, dx):
         return offset + height * np.exp(-((x - x0) ** 2) / (2 * dx**2))
 
-    # def Gorodetsky(x, offset, Lx0, Lheight, Ldx, Gx0, Gheight, Gdx):
-    #     Lorentz = Lheight * (1 + (x - Lx0) ** 2 / (Ldx / 2) ** 2) ** -1
-    #     Gauss = Gheight * np.exp(-((x - Gx0) ** 2) / (2 * Gdx**2))
-    #     return Lorentz + Gauss + offset
+    # Mechanical peak and calibration tone on the same offset
+    def Gorodetsky(x, offset, Lx0, Lheight, Ldx, Gx0, Gheight, Gdx):
+        Lorentz = Lheight * (1 + (x - Lx0) ** 2 / (Ldx / 2) ** 2) ** -1
+        Gauss = Gheight * np.exp(-((x - Gx0) ** 2) / (2 * Gdx**2))
+        return Lorentz + Gauss + offset
+
+    # Jacobians with respect to the parameters, shape x.shape + (n_parameters,)
+    # Parameters may be arrays of shape (N, 1) to evaluate N models at once
+    def Lorentz_jac(x, offset, x0, height, dx):
+        d = x - x0
+        L = 1 / (1 + 4 * d**2 / dx**2)
+        columns = (
+            1.0,
+            height * 8 * d * L**2 / dx**2,
+            L,
+            height * 8 * d**2 * L**2 / dx**3,
+        )
+        return np.stack(np.broadcast_arrays(*columns), axis=-1)
+
+    def Fano_jac(x, offset, x0, height, dx, q):
+        d = x - x0
+        L = 1 / (1 + 4 * d**2 / dx**2)
+        A = 1 - q**2 - q / dx * d
+        columns = (
+            1.0,
+            height * (q / dx * L + A * 8 * d * L**2 / dx**2),
+            A * L,
+            height * (q * d / dx**2 * L + A * 8 * d**2 * L**2 / dx**3),
+            height * L * (-2 * q - d / dx),
+        )
+        return np.stack(np.broadcast_arrays(*columns), axis=-1)
+
+    def Gauss_jac(x, offset, x0, height, dx):
+        d = x - x0
+        G = np.exp(-(d**2) / (2 * dx**2))
+        columns = (
+            1.0,
+            height * G * d / dx**2,
+            G,
+            height * G * d**2 / dx**3,
+        )
+        return np.stack(np.broadcast_arrays(*columns), axis=-1)
+
+    def Gorodetsky_jac(x, offset, Lx0, Lheight, Ldx, Gx0, Gheight, Gdx):
+        # Columns of both peaks, the offset column only once
+        L = Functions.Lorentz_jac(x, offset, Lx0, Lheight, Ldx)
+        G = Functions.Gauss_jac(x, offset, Gx0, Gheight, Gdx)
+        return np.concatenate([L, G[..., 1:]], axis=-1)
@@ -0,0 +1,172 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from catalog import is_data_file
+from data_io import describe_file, read_dataframe, read_rows, write_metadata
+from fitting import FIT_FUNCTIONS, FIT_PARAMETERS, fit_curve, make_fit_dict
+from gorodetsky import CALIBRATION_KEYS, DEFAULT_TEMPERATURE, g0_table
+
+
+def list_data_files(path):
+    """Data files in a folder, or files matching a glob pattern"""
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path)]
+    else:
+        files = glob.glob(path)
+    return sorted(f for f in files if is_data_file(f))
+
+
+def fit_file(
+    filename, func_name, lower=0, upper=1, width_ratio=None, maxfev=None, save=False
+):
+    """
+    Fit one file in the same way as the GUI does for the slider range
+    [lower, upper]. With save the results are added to the metadata of the file.
+    """
+    row = {"file": filename, "model": func_name}
+    try:
+        if filename.endswith(".h5"):
+            # Only the rows in the range are read
+            columns, length, _ = describe_file(filename)
+            up = int(upper * length)
+            low = int(lower * length)
+            df = read_rows(filename, low, up)
+            x = df[columns[0]]
+            y = df[columns[1]]
+        else:
+            df = read_dataframe(filename)
+            # Same range as PlotControl.replot
+            columns = list(df.keys())
+            up = int(upper * len(df[columns[0]]))
+            low = int(lower * len(df[columns[0]]))
+            x = df[columns[0]][low:up]
+            y = df[columns[1]][low:up]
+    except Exception as e:
+        row["status"] = f"read error: {e}"
+        return row
+    row["n_points"] = len(x)
+    if func_name == "Gorodetsky":
+        # Metadata of the measurement for g0
+        for key in CALIBRATION_KEYS:
+            row[key] = df.attrs.get(key, np.nan)
+
+    # A bad file must not stop the other files of the batch
+    try:
+        result = fit_curve(x, y, func_name, width_ratio=width_ratio, maxfev=maxfev)
+    except Exception as e:
+        row["status"] = f"failed: {e}"
+        return row
+    if result is None:
+        row["status"] = "failed"
+        return row
+
+    para, cov = result
+    row["status"] = "done"
+    errors = np.sqrt(np.abs(np.diag(cov)))
+    for name, value, error in zip(FIT_PARAMETERS[func_name], para, errors):
+        row[name] = value
+        row[f"{name}_err"] = error
+    row["covariance"] = cov
+
+    if save:
+        write_metadata(filename, make_fit_dict(func_name, para))
+    return row
+
+
+def fit_files(
+    path,
+    func_name,
+    lower=0,
+    upper=1,
+    width_ratio=None,
+    maxfev=None,
+    save=False,
+    workers=None,
+    temperature=DEFAULT_TEMPERATURE,
+):
+    """
+    Fit every file of a folder (or glob pattern, or list of files) in parallel.
+    Returns one row per file with parameters, standard errors and covariance.
+    The Gorodetsky model adds g0 and its standard error for each file.
+    """
+    if func_name not in FIT_FUNCTIONS:
+        raise ValueError(f"Unknown fit function {func_name}")
+
+    files = list_data_files(path) if isinstance(path, str) else list(path)
+    task = partial(
+        fit_file,
+        func_name=func_name,
+        lower=lower,
+        upper=upper,
+        width_ratio=width_ratio,
+        maxfev=maxfev,
+        save=save,
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(task, files, chunksize=8))
+
+    columns = ["file", "model", "status", "n_points"]
+    for name in FIT_PARAMETERS[func_name]:
+        columns += [name, f"{name}_err"]
+    columns.append("covariance")
+    results = pd.DataFrame(rows, columns=columns)
+
+    if func_name == "Gorodetsky":
+        for key in CALIBRATION_KEYS:
+            results[key] = [row.get(key, np.nan) for row in rows]
+        results = g0_table(
+            results.rename(columns={"covariance": "Gorodetsky_covariance"}),
+            temperature=temperature,
+        ).rename(columns={"Gorodetsky_covariance": "covariance"})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit all data files of a folder")
+    parser.add_argument("path", help="Folder or glob pattern of .h5/.pickle files")
+    parser.add_argument("--model", choices=list(FIT_FUNCTIONS), default="Lorentz")
+    parser.add_argument("--lower", type=float, default=0, help="Lower limit (0-1)")
+    parser.add_argument("--upper", type=float, default=1, help="Upper limit (0-1)")
+    parser.add_argument(
+        "--width-ratio",
+        type=float,
+        default=None,
+        help="Width of the peak as a fraction of the range, estimated if not given",
+    )
+    parser.add_argument("--maxfev", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--temperature",
+        type=float,
+        default=DEFAULT_TEMPERATURE,
+        help="Temperature (K) for g0 of the Gorodetsky model",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="Add results to the metadata of each file"
+    )
+    parser.add_argument("--output", default=None, help="Write results to .csv")
+    args = parser.parse_args()
+
+    results = fit_files(
+        args.path,
+        args.model,
+        lower=args.lower,
+        upper=args.upper,
+        width_ratio=args.width_ratio,
+        maxfev=args.maxfev,
+        save=args.save,
+        workers=args.workers,
+        temperature=args.temperature,
+    )
+
+    table = results.drop(columns="covariance")
+    if args.output is not None:
+        table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
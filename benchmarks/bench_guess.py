@@ -0,0 +1,105 @@
+"""
+Compare the simple initial guess (maximum and width ratio of the range) with
+the robust one (smoothed peak finding, half maximum width and linearized
+pre-fit, used without width ratio) on the files of Sample_Data.
+
+    python benchmarks/bench_guess.py
+
+For each case prints the function and Jacobian evaluations of curve_fit, the
+wall time including the guess, and the largest relative difference between
+the initial and the fitted position, height and width.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from data_io import read_dataframe
+from fitting import FIT_FUNCTIONS, FIT_JACOBIANS, fit_curve, initial_guess
+
+SAMPLE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "Sample_Data"
+)
+
+# (file, function, lower, upper, width ratio), width ratio as typed in the GUI
+CASES = [
+    ("gorodetsky.h5", "Lorentz", 0.7, 0.8, 0.1),
+    ("gorodetsky.h5", "Lorentz", 0.5, 1.0, None),
+    ("gorodetsky.h5", "Gauss", 0.3, 0.36, 0.01),
+    ("gorodetsky.h5", "Gauss", 0.2, 0.5, None),
+    ("gorodetsky.h5", "Gorodetsky", 0.0, 1.0, None),
+    ("optical_spectrum.h5", "Fano", 0.0, 1.0, None),
+    ("optical_spectrum.h5", "Fano", 0.0, 1.0, 0.1),
+]
+
+REPEAT = 20
+
+
+def count_calls(table, func_name):
+    """Wrap a function of the table to count its evaluations"""
+    func = table[func_name]
+    counter = [0]
+
+    def counted(*args):
+        counter[0] += 1
+        return func(*args)
+
+    table[func_name] = counted
+    return func, counter
+
+
+def run_case(x, y, func_name, width_ratio, robust):
+    func, nfev = count_calls(FIT_FUNCTIONS, func_name)
+    jac, njev = count_calls(FIT_JACOBIANS, func_name)
+    try:
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            result = fit_curve(x, y, func_name, width_ratio, robust=robust)
+        elapsed = (time.perf_counter() - start) / REPEAT
+    finally:
+        FIT_FUNCTIONS[func_name] = func
+        FIT_JACOBIANS[func_name] = jac
+    return result, elapsed, nfev[0] / REPEAT, njev[0] / REPEAT
+
+
+def seed_error(p0, para):
+    """Largest relative difference of position, height and width (not offset)"""
+    p0 = np.asarray(p0, dtype=np.float64)[1:]
+    para = np.asarray(para, dtype=np.float64)[1:]
+    # Widths of the same magnitude but opposite sign describe the same peak
+    return np.max(np.abs((np.abs(p0) - np.abs(para)) / para))
+
+
+if __name__ == "__main__":
+    for file, func_name, lower, upper, width_ratio in CASES:
+        df = read_dataframe(os.path.join(SAMPLE_DIR, file))
+        x_all = np.ascontiguousarray(df[list(df.keys())[0]], dtype=np.float64)
+        y_all = np.ascontiguousarray(df[list(df.keys())[1]], dtype=np.float64)
+        low, up = int(lower * len(x_all)), int(upper * len(x_all))
+        x, y = x_all[low:up], y_all[low:up]
+
+        print(
+            f"{file} {func_name} [{lower}, {upper}] width ratio {width_ratio} "
+            f"({len(x)} points)"
+        )
+        # Import of scipy.optimize is not timed
+        fit_curve(x, y, func_name, width_ratio)
+        for robust in (False, True):
+            # The robust guess is only used without width ratio
+            ratio = None if robust else width_ratio
+            result, elapsed, nfev, njev = run_case(x, y, func_name, ratio, robust)
+            label = "robust" if robust else "simple"
+            if result is None:
+                print(f"  {label}: failed ({nfev:.0f} evaluations)")
+                continue
+            p0 = initial_guess(x, y, func_name, ratio, robust=robust)
+            # Fano q is excluded, the guess is a constant
+            n = 4 if func_name == "Fano" else len(p0)
+            print(
+                f"  {label}: {elapsed * 1e3:7.2f} ms, {nfev:5.1f} + {njev:5.1f} "
+                f"evaluations, initial guess off by {seed_error(p0[:n], result[0][:n]):.1%}"
+            )
@@ -0,0 +1,80 @@
+"""
+Compare curve_fit with finite-difference and analytic Jacobians
+on Sample_Data/gorodetsky.h5.
+
+    python benchmarks/bench_jacobian.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from data_io import read_dataframe
+from fitting import FIT_FUNCTIONS, fit_curve
+
+SAMPLE = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "Sample_Data", "gorodetsky.h5"
+)
+
+# (function, lower, upper, width ratio) as selected with the sliders in the GUI
+CASES = [
+    ("Lorentz", 0.7, 0.8, 0.1),
+    ("Gauss", 0.3, 0.36, 0.01),
+]
+
+REPEAT = 50
+
+
+def count_calls(func_name):
+    """Wrap the model to count function evaluations"""
+    func = FIT_FUNCTIONS[func_name]
+    counter = [0]
+
+    def counted(*args):
+        counter[0] += 1
+        return func(*args)
+
+    FIT_FUNCTIONS[func_name] = counted
+    return func, counter
+
+
+def run_case(x, y, func_name, width_ratio, use_jac):
+    func, counter = count_calls(func_name)
+    try:
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            para, cov = fit_curve(x, y, func_name, width_ratio, use_jac=use_jac)
+        elapsed = (time.perf_counter() - start) / REPEAT
+    finally:
+        FIT_FUNCTIONS[func_name] = func
+    return para, elapsed, counter[0] / REPEAT
+
+
+if __name__ == "__main__":
+    df = read_dataframe(SAMPLE)
+    x_all = np.ascontiguousarray(df[list(df.keys())[0]], dtype=np.float64)
+    y_all = np.ascontiguousarray(df[list(df.keys())[1]], dtype=np.float64)
+
+    for func_name, lower, upper, width_ratio in CASES:
+        low, up = int(lower * len(x_all)), int(upper * len(x_all))
+        x, y = x_all[low:up], y_all[low:up]
+
+        para_fd, time_fd, nfev_fd = run_case(x, y, func_name, width_ratio, False)
+        para_jac, time_jac, nfev_jac = run_case(x, y, func_name, width_ratio, True)
+
+        print(f"{func_name} ({len(x)} points)")
+        print(
+            f"  finite difference: {time_fd * 1e3:8.3f} ms, {nfev_fd:6.1f} evaluations"
+        )
+        print(
+            f"  analytic jacobian: {time_jac * 1e3:8.3f} ms, {nfev_jac:6.1f} evaluations"
+        )
+        print(f"  speedup: {time_fd / time_jac:.2f}x")
+        print(
+            f"  max relative difference of parameters: "
+            f"{np.max(np.abs((para_jac - para_fd) / para_fd)):.2e}"
+        )
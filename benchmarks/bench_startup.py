@@ -0,0 +1,67 @@
+"""
+Measure the import time of main_program.py with python -X importtime
+and check it against a budget. Modules deferred to the first use must not
+be imported at startup.
+
+    python benchmarks/bench_startup.py [--budget SECONDS]
+
+Exits with status 1 when the budget is exceeded.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+# Import time of main_program allowed (seconds)
+BUDGET = 0.8
+# Imported when the first file is read or fitted
+DEFERRED = ["pandas", "scipy.optimize", "matplotlib.pyplot"]
+
+REPEAT = 5
+
+
+def import_times(module):
+    """(self, cumulative) time in seconds and nesting level of each imported module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us) * 1e-6, int(cumulative_us) * 1e-6, level)
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget", type=float, default=BUDGET, help="seconds")
+    parser.add_argument("--module", default="main_program")
+    args = parser.parse_args()
+
+    # Fastest run, the first ones also measure reading the files from disk
+    runs = [import_times(args.module) for _ in range(REPEAT)]
+    times = min(runs, key=lambda t: t[args.module][1])
+    total = times[args.module][1]
+
+    print(f"import {args.module}: {total * 1e3:.1f} ms (budget {args.budget:g} s)")
+    print("  slowest imports:")
+    top = [(name, t) for name, t in times.items() if t[2] == 1]
+    for name, (_, cumulative, _) in sorted(top, key=lambda item: -item[1][1])[:10]:
+        print(f"    {cumulative * 1e3:8.1f} ms  {name}")
+
+    loaded = [name for name in DEFERRED if name in times]
+    if loaded:
+        print(f"  imported at startup but deferred: {', '.join(loaded)}")
+
+    if total > args.budget or loaded:
+        sys.exit(1)
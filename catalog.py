@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import sqlite3
+from hashlib import sha1
+
+from data_io import describe_file, sidecar_path, to_builtin
+
+# Index file created in each data folder
+CATALOG_NAME = ".gui4opto_catalog.sqlite"
+# Used when the data folder is not writable
+CATALOG_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gui4opto")
+# Version of the tables, files are indexed again when it changes
+SCHEMA_VERSION = 1
+
+# One condition of a query, e.g. "Lorentz_linewidth < 5e3"
+CONDITION = re.compile(r"^\s*([^\s<>=!~]+)\s*(<=|>=|==|!=|=|<|>|~)\s*(.+?)\s*$")
+# Sort clause at the end of a query, e.g. "sort by Lorentz_linewidth desc"
+SORT = re.compile(r"(?:^|\s)sort\s+by\s+(\S+)(?:\s+(asc|desc))?\s*$", re.IGNORECASE)
+
+
+def is_data_file(filename):
+    # .npcol is a directory of memory-mapped columns
+    return (
+        filename.endswith(".pickle")
+        or filename.endswith(".h5")
+        or filename.endswith(".npcol")
+    )
+
+
+def metadata_path(path):
+    """Metadata written next to the data (.pickle sidecar, meta.json of .npcol)"""
+    if path.endswith(".pickle"):
+        return sidecar_path(path)
+    if path.endswith(".npcol"):
+        return os.path.join(path, "meta.json")
+
+
+def file_stat(path, stat=None, meta_mtime=None):
+    """
+    Size and mtime of a data file. Saving a fit may only rewrite its metadata
+    file, so mtime is the later one of both. meta_mtime is stat'ed if not given.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    if meta_mtime is None and metadata_path(path) is not None:
+        try:
+            meta_mtime = os.stat(metadata_path(path)).st_mtime_ns
+        except OSError:
+            pass
+    return stat.st_size, max(stat.st_mtime_ns, meta_mtime or 0)
+
+
+class FolderCatalog:
+    """
+    Persistent index (SQLite) of the data files in a folder.
+    Stores size, mtime, column names, length and metadata of each file.
+    refresh() only reads files which are new or whose size/mtime has changed.
+    """
+
+    def __init__(self, folder, db_path=None) -> None:
+        self.folder = folder
+        if db_path is None:
+            db_path = os.path.join(folder, CATALOG_NAME)
+        try:
+            self.conn = sqlite3.connect(db_path)
+            self.create_tables()
+        except sqlite3.OperationalError:
+            # Read-only folder, keep the index in the user cache instead
+            os.makedirs(CATALOG_DIR, exist_ok=True)
+            key = sha1(os.path.abspath(folder).encode()).hexdigest()
+            db_path = os.path.join(CATALOG_DIR, f"{key}.sqlite")
+            self.conn = sqlite3.connect(db_path)
+            self.create_tables()
+        self.db_path = db_path
+
+    def create_tables(self):
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute("DROP TABLE IF EXISTS attrs")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime INTEGER,
+                columns TEXT,
+                length INTEGER,
+                metadata TEXT
+            )
+            """)
+        # One row per metadata entry so that queries can use an index
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS attrs (
+                name TEXT,
+                key TEXT,
+                num REAL,
+                text TEXT
+            )
+            """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS attrs_num ON attrs (key, num)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS attrs_name ON attrs (name)")
+        self.conn.commit()
+
+    def scan(self):
+        """Size and mtime (see file_stat) of the data files currently in the folder"""
+        files = []
+        sidecars = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if is_data_file(entry.name) and (entry.is_file() or entry.is_dir()):
+                    files.append((entry.name, entry.path, entry.stat()))
+                elif entry.name.endswith(".pickle.meta.json"):
+                    sidecars[entry.name] = entry.stat().st_mtime_ns
+
+        # Sidecars are taken from the same listing, 0 if there is none
+        found = {}
+        for name, path, stat in files:
+            meta_mtime = None
+            if name.endswith(".pickle"):
+                meta_mtime = sidecars.get(os.path.basename(sidecar_path(name)), 0)
+            found[name] = file_stat(path, stat, meta_mtime)
+        return found
+
+    def refresh(self, found=None):
+        """
+        Update the index from the folder.
+        Returns names of the added or changed files and of the removed files.
+        """
+        if found is None:
+            found = self.scan()
+        known = {
+            name: (size, mtime)
+            for name, size, mtime in self.conn.execute(
+                "SELECT name, size, mtime FROM files"
+            )
+        }
+
+        removed = [name for name in known if name not in found]
+        changed = [name for name, stat in found.items() if known.get(name) != stat]
+
+        self.conn.executemany(
+            "DELETE FROM files WHERE name = ?", [(name,) for name in removed]
+        )
+        self.conn.executemany(
+            "DELETE FROM attrs WHERE name = ?", [(name,) for name in removed + changed]
+        )
+        for name in changed:
+            self.index_file(name, *found[name])
+        self.conn.commit()
+        return changed, removed
+
+    def update(self, names):
+        """
+        Update the index for the given files only, e.g. reported by a FolderWatcher.
+        Returns names of the files added to the index, of the changed files
+        and of the removed files.
+        """
+        added = []
+        changed = []
+        removed = []
+        for name in names:
+            try:
+                stat = file_stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                removed.append(name)
+                continue
+            known = self.conn.execute(
+                "SELECT size, mtime FROM files WHERE name = ?", (name,)
+            ).fetchone()
+            if known is None:
+                added.append((name, stat))
+            elif known != stat:
+                changed.append((name, stat))
+
+        self.conn.executemany(
+            "DELETE FROM files WHERE name = ?", [(name,) for name in removed]
+        )
+        self.conn.executemany(
+            "DELETE FROM attrs WHERE name = ?",
+            [(name,) for name in removed] + [(name,) for name, _ in added + changed],
+        )
+        for name, stat in added + changed:
+            self.index_file(name, *stat)
+        self.conn.commit()
+        return [name for name, _ in added], [name for name, _ in changed], removed
+
+    def index_file(self, name, size, mtime):
+        try:
+            columns, length, metadata = describe_file(os.path.join(self.folder, name))
+        except Exception:
+            # Partially written or broken file, listed without details
+            columns, length, metadata = [], None, {}
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                name,
+                size,
+                mtime,
+                json.dumps(columns),
+                length,
+                json.dumps(metadata, default=to_builtin),
+            ),
+        )
+
+        rows = []
+        for key, value in metadata.items():
+            if hasattr(value, "item"):
+                value = value.item()
+            if isinstance(value, (int, float)):
+                rows.append((name, key, value, str(value)))
+            else:
+                rows.append((name, key, None, str(value)))
+        self.conn.executemany("INSERT INTO attrs VALUES (?, ?, ?, ?)", rows)
+
+    def names(self):
+        """File names sorted by name"""
+        return [
+            name
+            for (name,) in self.conn.execute("SELECT name FROM files ORDER BY name")
+        ]
+
+    def query(self, expression):
+        """
+        File names whose metadata match the expression, answered from the index.
+        Conditions are "key op value" with op one of < <= > >= = == != ~
+        (~ matches a substring), combined with "and" / "or" ("and" binds first).
+        An optional "sort by key [desc]" at the end orders the result.
+        e.g. "Lorentz_linewidth < 5e3 and mod_power_dBm = -40 sort by Vpi desc"
+        """
+        order = "name"
+        params = []
+        match = SORT.search(expression)
+        if match is not None:
+            expression = expression[: match.start()]
+            key, direction = match.groups()
+            direction = "DESC" if direction and direction.lower() == "desc" else "ASC"
+            if key == "name":
+                order = f"name {direction}"
+            else:
+                # Numbers before text, files without the key are listed last
+                value = (
+                    "(SELECT {} FROM attrs WHERE attrs.name = files.name AND key = ?)"
+                )
+                order = (
+                    f"{value.format('text')} IS NULL, {value.format('num')} {direction}, "
+                    f"{value.format('text')} {direction}, name"
+                )
+                params = [key] * 3
+
+        groups = []
+        values = []
+        if expression.strip():
+            for group in re.split(r"\s+or\s+", expression.strip(), flags=re.IGNORECASE):
+                conditions = []
+                for condition in re.split(r"\s+and\s+", group, flags=re.IGNORECASE):
+                    sql, condition_values = self.condition_sql(condition)
+                    conditions.append(sql)
+                    values += condition_values
+                groups.append("(" + " AND ".join(conditions) + ")")
+        where = f"WHERE {' OR '.join(groups)}" if groups else ""
+
+        return [
+            name
+            for (name,) in self.conn.execute(
+                f"SELECT name FROM files {where} ORDER BY {order}", values + params
+            )
+        ]
+
+    def condition_sql(self, condition):
+        match = CONDITION.match(condition)
+        if match is None:
+            raise ValueError(f"Invalid condition: {condition}")
+        key, op, value = match.groups()
+        value = value.strip("\"'")
+        if op == "==":
+            op = "="
+
+        # File name can be used as a key as well
+        if key == "name":
+            if op == "~":
+                return "name LIKE ?", [f"%{value}%"]
+            return f"name {op} ?", [value]
+
+        subquery = "name IN (SELECT name FROM attrs WHERE key = ? AND {})"
+        if op == "~":
+            return subquery.format("text LIKE ?"), [key, f"%{value}%"]
+        try:
+            return subquery.format(f"num {op} ?"), [key, float(value)]
+        except ValueError:
+            # Strings can only be compared for (in)equality
+            if op not in ("=", "!="):
+                raise ValueError(f"Invalid condition: {condition}")
+            return subquery.format(f"text {op} ?"), [key, value]
+
+    def get(self, name):
+        row = self.conn.execute(
+            "SELECT size, mtime, columns, length, metadata FROM files WHERE name = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return
+        return {
+            "name": name,
+            "size": row[0],
+            "mtime": row[1],
+            "columns": json.loads(row[2]),
+            "length": row[3],
+            "metadata": json.loads(row[4]),
+        }
+
+    def close(self):
+        self.conn.close()
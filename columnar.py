@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_io import read_dataframe, write_json_atomic
+
+# Directory with one .npy file per column and meta.json
+COLUMNAR_EXT = ".npcol"
+META_NAME = "meta.json"
+
+
+class MappedFrame:
+    """
+    Columns of a .npcol directory mapped into memory.
+    Used like a read-only DataFrame: keys(), df[column], len(df) and df.attrs.
+    Columns are numpy memmaps, so a slice df[column][low:up] only reads the
+    pages it covers.
+    """
+
+    def __init__(self, path, columns, arrays, attrs) -> None:
+        self.path = path
+        self.columns = list(columns)
+        self.arrays = dict(zip(self.columns, arrays))
+        self.attrs = dict(attrs)
+
+    def keys(self):
+        return list(self.columns)
+
+    def __getitem__(self, column):
+        return self.arrays[column]
+
+    def __contains__(self, column):
+        return column in self.arrays
+
+    def __len__(self):
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    def copy(self, deep=False):
+        """Frame sharing the mapped columns, with its own attrs"""
+        arrays = [self.arrays[column] for column in self.columns]
+        if deep:
+            arrays = [np.array(array) for array in arrays]
+        return MappedFrame(self.path, self.columns, arrays, self.attrs)
+
+    def memory_usage(self, index=True, deep=False):
+        # Mapped pages belong to the page cache of the OS, not to the process
+        return np.zeros(len(self.columns), dtype=np.int64)
+
+    def to_pandas(self):
+        df = pd.DataFrame({column: np.asarray(self[column]) for column in self.columns})
+        df.attrs = dict(self.attrs)
+        return df
+
+
+def meta_path(path):
+    return os.path.join(path, META_NAME)
+
+
+def read_meta(path):
+    with open(meta_path(path)) as f:
+        return json.load(f)
+
+
+def read_columns(path):
+    """MappedFrame of a .npcol directory"""
+    meta = read_meta(path)
+    arrays = [
+        np.load(os.path.join(path, name), mmap_mode="r") for name in meta["files"]
+    ]
+    return MappedFrame(path, meta["columns"], arrays, meta["attrs"])
+
+
+def write_meta(path, meta):
+    write_json_atomic(meta_path(path), meta)
+
+
+def write_attrs(path, attrs):
+    """Add attrs to the metadata without touching the columns"""
+    meta = read_meta(path)
+    meta["attrs"].update(attrs)
+    write_meta(path, meta)
+
+
+def write_columns(path, df):
+    """
+    Write the columns and attrs of a DataFrame as a .npcol directory.
+    The directory is written under a temporary name and renamed when complete,
+    so readers (and FolderWatcher) never see a partial one.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    # Column names may contain any character, files are numbered instead
+    files = []
+    for i, column in enumerate(df.keys()):
+        array = np.ascontiguousarray(df[column])
+        if array.dtype == object:
+            shutil.rmtree(tmp_path)
+            raise ValueError(f"Column {column!r} can not be memory-mapped")
+        name = f"col{i}.npy"
+        np.save(os.path.join(tmp_path, name), array)
+        files.append(name)
+    write_meta(
+        tmp_path,
+        {"columns": list(df.keys()), "files": files, "attrs": dict(df.attrs)},
+    )
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def convert(filename, out_path=None):
+    """Convert a .h5 or .pickle file to .npcol next to it"""
+    if out_path is None:
+        out_path = os.path.splitext(filename)[0] + COLUMNAR_EXT
+    df = read_dataframe(filename)
+    if df is None:
+        return
+    return write_columns(out_path, df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert .h5/.pickle files to memory-mapped .npcol directories"
+    )
+    parser.add_argument("paths", nargs="+", help="Files or folders")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            files = [path]
+        for file in files:
+            if file.endswith(".h5") or file.endswith(".pickle"):
+                print(f"{file} -> {convert(file)}")
@@ -0,0 +1,166 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from data_io import file_signature, read_dataframe, read_metadata
+
+# Default memory budget for cached DataFrames (bytes)
+DEFAULT_BUDGET = 512 * 1024**2
+# Worker processes are only started when at least this many files are not cached
+PARALLEL_MIN_FILES = 8
+
+
+class DataCache:
+    """
+    LRU cache of DataFrames shared by all PlotControl instances.
+    Entries are keyed by path and validated with mtime and size of the file,
+    so each file is parsed only once per change.
+    Returned DataFrames are shared and should be treated as read-only.
+    It can be used from several threads, e.g. by a Prefetcher; a file which is
+    being read by one thread is not read again by another one.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET) -> None:
+        self.budget = budget
+        # path -> (signature, df, nbytes)
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.RLock()
+        # path -> Event set when the file being read is in the cache
+        self.reading = {}
+
+    def load(self, filename, read=read_dataframe):
+        """
+        Return DataFrame of the file, reading it only if it has changed.
+        read is called to read the file, e.g. data_io.read_chunked.
+        """
+        signature = file_signature(filename)
+        key = signature[0]
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == signature:
+                    self.entries.move_to_end(key)
+                    return entry[1]
+
+                reading = self.reading.get(key)
+                if reading is None:
+                    reading = self.reading[key] = threading.Event()
+                    break
+            # Wait for the other thread, then check the cache again
+            reading.wait()
+
+        try:
+            df = read(filename)
+            if df is not None:
+                self._insert(key, signature, df)
+        finally:
+            with self.lock:
+                del self.reading[key]
+            reading.set()
+        return df
+
+    def load_many(self, filenames, workers=None):
+        """
+        Return {filename: DataFrame} of several files in the given order.
+        Files which are not cached are read by worker processes when there are
+        many of them: PyTables holds the GIL (and HDF5_LOCK) while reading,
+        so threads would still read one file at a time.
+        """
+        dfs = {filename: self.get(filename) for filename in filenames}
+        missing = [filename for filename, df in dfs.items() if df is None]
+
+        # Mapping .npcol is instant, and sending it between processes would copy it
+        for filename in [f for f in missing if f.endswith(".npcol")]:
+            dfs[filename] = self.load(filename)
+            missing.remove(filename)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(missing))
+        if workers > 1 and len(missing) >= PARALLEL_MIN_FILES:
+            # Signature before reading, a file changed meanwhile is read again later
+            signatures = [file_signature(filename) for filename in missing]
+            chunksize = -(-len(missing) // (4 * workers))
+            with ProcessPoolExecutor(workers) as executor:
+                results = executor.map(read_dataframe, missing, chunksize=chunksize)
+                for filename, signature, df in zip(missing, signatures, results):
+                    if df is not None:
+                        self._insert(signature[0], signature, df)
+                    dfs[filename] = df
+        else:
+            for filename in missing:
+                dfs[filename] = self.load(filename)
+        return dfs
+
+    def get(self, filename):
+        """Return cached DataFrame only if it is up to date, without reading the file"""
+        signature = file_signature(filename)
+        with self.lock:
+            entry = self.entries.get(signature[0])
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+    def put(self, filename, df):
+        """Store DataFrame that has just been written to the file"""
+        signature = file_signature(filename)
+        self._insert(signature[0], signature, df)
+
+    def invalidate(self, filename):
+        with self.lock:
+            entry = self.entries.pop(os.path.abspath(filename), None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def _insert(self, key, signature, df):
+        nbytes = int(df.memory_usage(index=True, deep=False).sum())
+        with self.lock:
+            self.invalidate(key)
+            self.entries[key] = (signature, df, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries, but always keep the newest one
+        while self.nbytes > self.budget and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.nbytes -= entry[2]
+
+
+# Cache shared by the whole process
+shared_cache = DataCache(
+    budget=int(os.environ.get("GUI4OPTO_CACHE_MB", DEFAULT_BUDGET // 1024**2)) * 1024**2
+)
+
+
+def load_dataframe(filename):
+    return shared_cache.load(filename)
+
+
+def load_dataframes(filenames, workers=None):
+    return shared_cache.load_many(filenames, workers)
+
+
+def load_metadata(filename):
+    """Metadata of the file, read without the data when possible"""
+    df = shared_cache.get(filename)
+    if df is None and filename.endswith(".h5"):
+        return read_metadata(filename)
+
+    if df is None:
+        df = shared_cache.load(filename)
+        if df is None:
+            return
+    return dict(df.attrs)
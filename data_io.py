@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+# PyTables is not thread-safe, HDF5 files are accessed by one thread at a time
+HDF5_LOCK = threading.RLock()
+# Threads waiting for HDF5_LOCK, background reads give way to them
+HDF5_WAITING = threading.Condition()
+waiting_threads = 0
+# Rows read at a time by background reads, HDF5_LOCK is released in between
+CHUNK_ROWS = 1 << 20
+# Signature of each file after write_metadata of this process, see is_own_write
+METADATA_WRITES = {}
+
+
+def acquire_hdf5(background=False):
+    """
+    Acquire HDF5_LOCK. A background thread (prefetch) waits until no other
+    thread waits for the lock, so the file being shown is never read after it.
+    """
+    global waiting_threads
+    if not background:
+        with HDF5_WAITING:
+            waiting_threads += 1
+        HDF5_LOCK.acquire()
+        with HDF5_WAITING:
+            waiting_threads -= 1
+            HDF5_WAITING.notify_all()
+        return
+
+    while True:
+        with HDF5_WAITING:
+            HDF5_WAITING.wait_for(lambda: waiting_threads == 0)
+        HDF5_LOCK.acquire()
+        with HDF5_WAITING:
+            if waiting_threads == 0:
+                return
+        HDF5_LOCK.release()
+
+
+@contextmanager
+def open_store(filename, mode="r", background=False):
+    """HDFStore of the file, opened while holding HDF5_LOCK"""
+    # pandas is imported on the first read, not at the start of the GUI
+    import pandas as pd
+
+    acquire_hdf5(background)
+    try:
+        with pd.HDFStore(filename, mode=mode) as store:
+            yield store
+    finally:
+        HDF5_LOCK.release()
+
+
+def read_dataframe(filename):
+    """
+    Read DataFrame and its metadata from .pickle or .h5 file.
+    .npcol directories are returned as a MappedFrame (memory-mapped columns).
+    """
+    if filename.endswith(".npcol"):
+        from columnar import read_columns
+
+        return read_columns(filename)
+
+    elif filename.endswith(".pickle"):
+        import pandas as pd
+
+        df = pd.read_pickle(filename)
+        # Metadata written after the pickle was created
+        df.attrs.update(read_sidecar(filename))
+
+    elif filename.endswith(".h5"):
+        # Read DataFrame and retrieve attributes
+        with open_store(filename) as store:
+            df = store["df"]  # Load the DataFrame
+            df.attrs = store.get_storer("df").attrs.metadata
+
+    else:
+        return
+
+    return df
+
+
+def read_chunked(filename):
+    """
+    read_dataframe for a background thread. .h5 files are read CHUNK_ROWS rows
+    at a time and other threads get HDF5_LOCK in between, so that they do not
+    wait for the whole file.
+    """
+    if not filename.endswith(".h5"):
+        return read_dataframe(filename)
+
+    import pandas as pd
+
+    with open_store(filename, background=True) as store:
+        storer = store.get_storer("df")
+        length = int(storer.nrows if storer.is_table else storer.shape[0])
+    chunks = [
+        read_rows(filename, start, start + CHUNK_ROWS, background=True)
+        for start in range(0, max(length, 1), CHUNK_ROWS)
+    ]
+    df = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    df.attrs = chunks[-1].attrs
+    return df
+
+
+def read_rows(filename, start=None, stop=None, background=False):
+    """
+    Rows [start, stop) of .h5 file and its metadata, only these rows are read.
+    Files whose format does not support selecting rows are read fully.
+    """
+    with open_store(filename, background=background) as store:
+        try:
+            df = store.select("df", start=start, stop=stop)
+        except (TypeError, ValueError, NotImplementedError):
+            df = store["df"].iloc[start:stop]
+        df.attrs = dict(store.get_storer("df").attrs.metadata)
+    return df
+
+
+def read_metadata(filename):
+    """Read only the metadata of .h5 file"""
+    with open_store(filename) as store:
+        return dict(store.get_storer("df").attrs.metadata)
+
+
+def describe_file(filename):
+    """
+    Column names, number of rows and metadata of the file.
+    For .h5 only the first row and the attributes are read.
+    """
+    if filename.endswith(".h5"):
+        with open_store(filename) as store:
+            storer = store.get_storer("df")
+            head = store.select("df", start=0, stop=1)
+            length = storer.nrows if storer.is_table else storer.shape[0]
+            return list(head.keys()), int(length), dict(storer.attrs.metadata)
+
+    df = read_dataframe(filename)
+    return list(df.keys()), len(df), dict(df.attrs)
+
+
+def write_metadata(filename, attrs):
+    """
+    Add attrs to the metadata of the file without rewriting the data.
+    For .h5 only the attribute of the storer is replaced.
+    For .pickle the metadata is kept in a sidecar file next to it.
+    For .npcol only meta.json in the directory is replaced.
+    """
+    if filename.endswith(".npcol"):
+        from columnar import write_attrs
+
+        write_attrs(filename, attrs)
+
+    elif filename.endswith(".pickle"):
+        metadata = read_sidecar(filename)
+        metadata.update(attrs)
+        write_json_atomic(sidecar_path(filename), metadata)
+
+    elif filename.endswith(".h5"):
+        with open_store(filename, mode="a") as store:
+            storer = store.get_storer("df")
+            metadata = dict(storer.attrs.metadata)
+            metadata.update(attrs)
+            storer.attrs.metadata = metadata
+
+    else:
+        return
+
+    signature = file_signature(filename)
+    METADATA_WRITES[signature[0]] = signature
+
+
+def is_own_write(filename):
+    """True if the file has not changed since this process wrote its metadata"""
+    try:
+        signature = file_signature(filename)
+    except OSError:
+        return False
+    return METADATA_WRITES.get(signature[0]) == signature
+
+
+def sidecar_path(filename):
+    return filename + ".meta.json"
+
+
+def write_json_atomic(path, data):
+    """Write data as JSON, replacing the file at path only when complete"""
+    # Write to a temporary file first so that a crash never leaves a broken file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1, default=to_builtin)
+    os.replace(tmp_path, path)
+
+
+def read_sidecar(filename):
+    try:
+        with open(sidecar_path(filename)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def file_signature(filename):
+    """Path, modification time and size to detect changes of the file"""
+    stat = os.stat(filename)
+    signature = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if filename.endswith(".pickle") and os.path.exists(sidecar_path(filename)):
+        signature += (os.stat(sidecar_path(filename)).st_mtime_ns,)
+    elif filename.endswith(".npcol"):
+        signature += (os.stat(os.path.join(filename, "meta.json")).st_mtime_ns,)
+    return signature
+
+
+def to_builtin(value):
+    # numpy scalars are not JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
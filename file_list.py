@@ -0,0 +1,208 @@
+import bisect
+import os
+
+import customtkinter
+
+# Height of one row in pixels
+ROW_HEIGHT = 30
+
+
+class VirtualFileList(customtkinter.CTkFrame):
+    """
+    Scrollable list of file names which only creates widgets for visible rows.
+    A fixed pool of radio buttons (mode="radio") or checkboxes (mode="check")
+    is reused while scrolling, so thousands of files cost one screen of widgets.
+    """
+
+    def __init__(
+        self,
+        *args,
+        mode="radio",
+        variable=None,
+        command=None,
+        empty_text="No .pickle or .h5 file found in the folder.",
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.mode = mode
+        # StringVar holding the full path of the selected file (radio)
+        self.variable = variable
+        self.command = command
+        self.empty_text = empty_text
+
+        self.folder = ""
+        self.names = []
+        # Checked file names (check)
+        self.checked = set()
+        # Index of the first visible row
+        self.top = 0
+        self.rows = []
+
+        self.setup_form()
+
+    def setup_form(self):
+        # Resize configuration
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.body = customtkinter.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+        self.body.grid_columnconfigure(0, weight=1)
+        self.body.bind("<Configure>", self.on_resize)
+
+        self.scrollbar = customtkinter.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.message = customtkinter.CTkLabel(self.body, text="")
+
+        self.bind_wheel(self.body)
+
+    def bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_wheel)
+        # Linux
+        widget.bind("<Button-4>", lambda event: self.scroll(-3))
+        widget.bind("<Button-5>", lambda event: self.scroll(3))
+
+    def set_items(self, folder, names):
+        """Show file names of the folder"""
+        self.folder = folder
+        self.names = list(names)
+        self.checked &= set(self.names)
+        self.top = min(self.top, max(len(self.names) - len(self.rows), 0))
+        self.show_message()
+        self.refresh()
+
+    def add_items(self, names):
+        """Insert file names keeping the list sorted, without rebuilding it"""
+        for name in names:
+            index = bisect.bisect_left(self.names, name)
+            if index == len(self.names) or self.names[index] != name:
+                self.names.insert(index, name)
+        self.show_message()
+        self.refresh()
+
+    def remove_items(self, names):
+        for name in names:
+            index = bisect.bisect_left(self.names, name)
+            if index < len(self.names) and self.names[index] == name:
+                del self.names[index]
+            self.checked.discard(name)
+        self.top = min(self.top, max(len(self.names) - len(self.rows), 0))
+        self.show_message()
+        self.refresh()
+
+    def show_message(self):
+        if self.names:
+            self.message.grid_forget()
+        else:
+            self.message.configure(text=self.empty_text)
+            self.message.grid(row=0, column=0, pady=10)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def index(self, path):
+        """Position of the file in the list, None if it is not listed"""
+        try:
+            return self.names.index(os.path.basename(path))
+        except ValueError:
+            return
+
+    def neighbours(self, path, depth=1):
+        """Paths of the files after and before the file, nearest first"""
+        index = self.index(path)
+        if index is None:
+            return []
+
+        paths = []
+        for i in range(1, depth + 1):
+            for j in (index + i, index - i):
+                if 0 <= j < len(self.names):
+                    paths.append(self.path(self.names[j]))
+        return paths
+
+    def see(self, index):
+        """Scroll so that the row is visible"""
+        if index < self.top:
+            self.scroll(index - self.top)
+        elif index >= self.top + len(self.rows):
+            self.scroll(index - self.top - len(self.rows) + 1)
+
+    def get_checked(self):
+        """Full paths of the checked files in the order of the list"""
+        return [self.path(name) for name in self.names if name in self.checked]
+
+    def on_resize(self, event):
+        # Number of rows which fit in the frame
+        n_rows = max(event.height // ROW_HEIGHT, 1)
+        while len(self.rows) < n_rows:
+            self.rows.append(self.create_row(len(self.rows)))
+        while len(self.rows) > n_rows:
+            self.rows.pop().destroy()
+        self.refresh()
+
+    def create_row(self, i):
+        if self.mode == "radio":
+            row = customtkinter.CTkRadioButton(
+                self.body, text="", variable=self.variable, command=self.command
+            )
+        else:
+            row = customtkinter.CTkCheckBox(
+                self.body, text="", command=lambda: self.toggle_row(i)
+            )
+        self.bind_wheel(row)
+        return row
+
+    def toggle_row(self, i):
+        name = self.names[self.top + i]
+        if self.rows[i].get():
+            self.checked.add(name)
+        else:
+            self.checked.discard(name)
+        if self.command is not None:
+            self.command()
+
+    def refresh(self):
+        """Assign file names to the row widgets from the first visible row"""
+        for i, row in enumerate(self.rows):
+            index = self.top + i
+            if index >= len(self.names):
+                row.grid_remove()
+                continue
+
+            name = self.names[index]
+            if self.mode == "radio":
+                row.configure(text=name, value=self.path(name))
+            else:
+                row.configure(text=name)
+                if name in self.checked:
+                    row.select()
+                else:
+                    row.deselect()
+            row.grid(row=i, column=0, padx=5, pady=2, sticky="w")
+
+        # Position of the scrollbar
+        if self.names:
+            self.scrollbar.set(
+                self.top / len(self.names),
+                min((self.top + len(self.rows)) / len(self.names), 1),
+            )
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, n_rows):
+        top = min(max(self.top + n_rows, 0), max(len(self.names) - len(self.rows), 0))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+
+    def on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll(int(float(args[1]) * len(self.names)) - self.top)
+        elif args[0] == "scroll":
+            n = int(args[1])
+            self.scroll(n * len(self.rows) if args[2] == "pages" else n)
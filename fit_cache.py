@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog import CATALOG_DIR
+from fitting import fit_curve
+
+# Fit results kept in memory
+DEFAULT_SIZE = 256
+# Fit results kept on disk, the oldest ones are deleted
+DEFAULT_DISK_SIZE = 100000
+# Default store of fit results between sessions, GUI4OPTO_FIT_CACHE="" disables it
+FIT_CACHE_PATH = os.path.join(CATALOG_DIR, "fit_cache.sqlite")
+# Version of the stored results, increase when fitting gives different results
+SCHEMA_VERSION = 1
+
+
+def data_hash(x, y):
+    """Hash of the content of x and y as float64"""
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (x, y):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        digest.update(len(values).to_bytes(8, "little"))
+        digest.update(memoryview(values).cast("B"))
+    return digest.hexdigest()
+
+
+def fit_key(x, y, func_name, width_ratio=None, maxfev=None, bounds=None):
+    """Key of a fit of x and y, bounds is the (low, up) range of the rows"""
+    if bounds is not None:
+        bounds = [None if b is None else int(b) for b in bounds]
+    return json.dumps([data_hash(x, y), func_name, width_ratio, maxfev, bounds])
+
+
+class FitCache:
+    """
+    LRU cache of fit results (para, cov) keyed with fit_key, so that a range
+    fitted before is not fitted again. Failed fits are not kept.
+    With a path the results are also stored in a SQLite file and survive
+    restarts of the GUI. Returned arrays are shared and should be treated as
+    read-only.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, path=None, disk_size=DEFAULT_DISK_SIZE):
+        self.size = size
+        self.path = path
+        self.disk_size = disk_size
+        # key -> (para, cov)
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        # Opened on first use, nothing is written when the cache is not used
+        self.conn = None
+
+    def connect(self):
+        if self.conn is not None or not self.path:
+            return self.conn
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self.conn.execute("DROP TABLE IF EXISTS fits")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fits (key TEXT PRIMARY KEY, result TEXT)"
+            )
+            self.conn.commit()
+        except (OSError, sqlite3.Error):
+            # Not writable, results are kept in memory only
+            self.conn = None
+            self.path = None
+        return self.conn
+
+    def get(self, key):
+        """(para, cov) of the key, or None if it has not been fitted"""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                return result
+
+            conn = self.connect()
+            if conn is None:
+                return
+            try:
+                row = conn.execute(
+                    "SELECT result FROM fits WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                return
+            if row is None:
+                return
+            stored = json.loads(row[0])
+            result = (np.array(stored["para"]), np.array(stored["cov"]))
+            self._insert(key, result)
+            return result
+
+    def put(self, key, result):
+        """Keep the result (para, cov) of a fit"""
+        if result is None:
+            return
+        para, cov = result
+        result = (np.array(para, dtype=np.float64), np.array(cov, dtype=np.float64))
+        with self.lock:
+            self._insert(key, result)
+
+            conn = self.connect()
+            if conn is None:
+                return
+            stored = json.dumps({"para": result[0].tolist(), "cov": result[1].tolist()})
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO fits (key, result) VALUES (?, ?)",
+                    (key, stored),
+                )
+                # Replaced rows get a new rowid, the lowest ones are the oldest
+                conn.execute(
+                    "DELETE FROM fits WHERE rowid <= (SELECT MAX(rowid) FROM fits) - ?",
+                    (self.disk_size,),
+                )
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def fit(self, x, y, func_name, width_ratio=None, maxfev=None, bounds=None):
+        """fit_curve, or its result from the cache if fitted before"""
+        key = fit_key(x, y, func_name, width_ratio, maxfev, bounds)
+        result = self.get(key)
+        if result is None:
+            result = fit_curve(x, y, func_name, width_ratio=width_ratio, maxfev=maxfev)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            conn = self.connect()
+            if conn is not None:
+                conn.execute("DELETE FROM fits")
+                conn.commit()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _insert(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+# Shared like data_cache.shared_cache
+shared_fit_cache = FitCache(path=os.environ.get("GUI4OPTO_FIT_CACHE", FIT_CACHE_PATH))
@@ -0,0 +1,228 @@
+import numpy as np
+
+# Points at both ends used for the offset (fraction of the range)
+EDGE_FRACTION = 0.05
+# Smoothing window as a fraction of the width of the peak
+SMOOTH_FRACTION = 0.2
+# Points of the peak above this fraction of its height are used for the pre-fit
+PREFIT_LEVEL = 0.3
+# Alternating pre-fits of the shape and linear fits of offset and height
+PREFIT_ITERATIONS = 3
+
+# Ratio of the full width at half maximum to sigma of a Gaussian
+FWHM_SIGMA = 2 * np.sqrt(2 * np.log(2))
+
+
+def smooth(y, window):
+    """Moving average over an odd number of points, same length as y"""
+    if window <= 1:
+        return y
+    pad = window // 2
+    total = np.cumsum(np.pad(y, (pad + 1, pad), mode="edge"))
+    return (total[window:] - total[:-window]) / window
+
+
+def estimate_offset(y):
+    """Background level from the median of the points at both ends"""
+    n = min(max(int(len(y) * EDGE_FRACTION), 10), len(y))
+    return float(np.median(np.concatenate([y[:n], y[-n:]])))
+
+
+def peak_bounds(d, i, level):
+    """Indices of the first points below level on both sides of index i"""
+    below = np.flatnonzero(d[:i] < level)
+    left = below[-1] if len(below) else 0
+    below = np.flatnonzero(d[i:] < level)
+    right = i + below[0] if len(below) else len(d) - 1
+    return left, right
+
+
+def find_peak(x, d):
+    """
+    Index, height and full width at half maximum of the highest peak of d
+    (data minus offset). The peak is searched again on d smoothed over a
+    fraction of its width, so that noise neither shifts it nor cuts the width.
+    """
+    i = int(np.nanargmax(d))
+    left, right = peak_bounds(d, i, d[i] / 2)
+    window = 2 * int((right - left) * SMOOTH_FRACTION / 2) + 1
+    if window > 1:
+        d = smooth(d, window)
+        i = int(np.nanargmax(d))
+        left, right = peak_bounds(d, i, d[i] / 2)
+    return i, d[i], abs(x[right] - x[left])
+
+
+def detect_peaks(x, y, offset, n_peaks=2):
+    """
+    Highest peaks of y above offset, found one after the other.
+    Around each peak the points down to half of its height, and as many again
+    on both sides, are excluded before looking for the next one.
+    Returns (index, height, full width at half maximum) of each peak.
+    """
+    d = np.asarray(y, dtype=np.float64) - offset
+    peaks = []
+    for _ in range(n_peaks):
+        i, height, width = find_peak(x, d)
+        if not height > 0:
+            break
+        peaks.append((i, height, width))
+
+        left, right = peak_bounds(d, i, height / 2)
+        span = right - left + 1
+        d = d.copy()
+        d[max(left - span, 0) : right + span + 1] = 0
+    return peaks
+
+
+def lorentz_shape(x, x0, fwhm):
+    return 1 / (1 + (x - x0) ** 2 / (fwhm / 2) ** 2)
+
+
+def gauss_shape(x, x0, fwhm):
+    return np.exp(-((x - x0) ** 2) / (2 * (fwhm / FWHM_SIGMA) ** 2))
+
+
+def prefit_peak(x, d, x0, height, fwhm, shape):
+    """
+    Linearized fit of one peak of d (data minus offset), using the points above
+    PREFIT_LEVEL of the height around x0. A Lorentzian is a parabola in 1/d and
+    a Gaussian in log(d), both are fitted by weighted linear least squares.
+    d is smoothed first, noise would bias 1/d and log(d) on the flanks.
+    Returns (x0, height, fwhm), or None if the points do not form a peak.
+    """
+    if not fwhm > 0:
+        return
+    i = int(np.argmin(np.abs(x - x0)))
+    spacing = abs(x[min(i + 1, len(x) - 1)] - x[max(i - 1, 0)]) / 2
+    if not spacing > 0:
+        # Repeated x values, e.g. at the turn of a sweep up and down
+        steps = np.abs(np.diff(x))
+        steps = steps[steps > 0]
+        if len(steps) == 0:
+            return
+        spacing = np.median(steps)
+    points = fwhm / spacing
+    d = smooth(d, 2 * int(points * SMOOTH_FRACTION / 2) + 1)
+    left, right = peak_bounds(d, i, PREFIT_LEVEL * height)
+    t = (x[left : right + 1] - x0) / fwhm
+    v = d[left : right + 1]
+    inside = v > 0
+    t, v = t[inside], v[inside]
+    if len(v) < 5:
+        return
+
+    # Weights make the residuals comparable to the residuals of d
+    if shape is lorentz_shape:
+        target, weight = 1 / v, v**2
+    else:
+        target, weight = np.log(v), v
+    A = np.stack([np.ones_like(t), t, t**2], axis=-1) * weight[:, None]
+    p0, p1, p2 = np.linalg.lstsq(A, target * weight, rcond=None)[0]
+
+    center = -p1 / (2 * p2)
+    top = p0 - p1**2 / (4 * p2)
+    if shape is lorentz_shape:
+        if not (p2 > 0 and top > 0):
+            return
+        new_height = 1 / top
+        new_fwhm = 2 / np.sqrt(new_height * p2) * fwhm
+    else:
+        if not p2 < 0:
+            return
+        new_height = np.exp(top)
+        new_fwhm = np.sqrt(-1 / (2 * p2)) * FWHM_SIGMA * fwhm
+
+    new_x0 = x0 + center * fwhm
+    if not (np.isfinite(new_height) and np.isfinite(new_fwhm)):
+        return
+    # A pre-fit far outside the peak is not trusted
+    if abs(new_x0 - x0) > fwhm or not 0.1 < new_fwhm / fwhm < 10:
+        return
+    return new_x0, new_height, new_fwhm
+
+
+def fit_heights(x, y, peaks):
+    """Offset and heights of peaks [(x0, fwhm, shape), ...] by linear least squares"""
+    A = np.stack(
+        [np.ones_like(x)] + [shape(x, x0, fwhm) for x0, fwhm, shape in peaks],
+        axis=-1,
+    )
+    solution = np.linalg.lstsq(A, y, rcond=None)[0]
+    return solution[0], solution[1:]
+
+
+def guess_peaks(x, y, peaks, offset):
+    """
+    Refine peaks [(x0, height, fwhm, shape), ...] on the offset: each peak is
+    pre-fitted with the other peaks subtracted, then offset and heights are
+    fitted linearly, a few times over.
+    Returns the offset and the refined peaks.
+    """
+    peaks = list(peaks)
+    for _ in range(PREFIT_ITERATIONS):
+        for k, (x0, height, fwhm, shape) in enumerate(peaks):
+            d = y - offset
+            for j, (other_x0, other_height, other_fwhm, other_shape) in enumerate(
+                peaks
+            ):
+                if j != k:
+                    d = d - other_height * other_shape(x, other_x0, other_fwhm)
+            result = prefit_peak(x, d, x0, height, fwhm, shape)
+            if result is not None:
+                peaks[k] = result + (shape,)
+
+        offset, heights = fit_heights(
+            x, y, [(x0, fwhm, shape) for x0, _, fwhm, shape in peaks]
+        )
+        peaks = [
+            (x0, height, fwhm, shape)
+            for (x0, _, fwhm, shape), height in zip(peaks, heights)
+        ]
+    return offset, peaks
+
+
+def robust_guess(x, y, func_name):
+    """
+    Initial parameters in the order of FitFunctions from the peaks of the data.
+    Widths are the full width at half maximum, refined with positions and
+    heights by the linearized pre-fit.
+    Returns None if no peak is found.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    offset = estimate_offset(y)
+
+    # Optical resonance is a dip, only its position and width are estimated
+    if func_name == "Fano":
+        peaks = detect_peaks(x, -y, -offset, n_peaks=1)
+        if not peaks:
+            return
+        i, depth, fwhm = peaks[0]
+        return [offset, x[i], -depth, fwhm, 0.1]
+
+    n_peaks = 2 if func_name == "Gorodetsky" else 1
+    found = detect_peaks(x, y, offset, n_peaks=n_peaks)
+    if len(found) < n_peaks or any(width <= 0 for _, _, width in found):
+        return
+
+    if func_name == "Gorodetsky":
+        # The tone is narrower, its width is set by the resolution bandwidth
+        tone, mech = sorted(found, key=lambda peak: peak[2])
+        peaks = [
+            (x[mech[0]], mech[1], mech[2], lorentz_shape),
+            (x[tone[0]], tone[1], tone[2], gauss_shape),
+        ]
+    else:
+        i, height, fwhm = found[0]
+        shape = gauss_shape if func_name == "Gauss" else lorentz_shape
+        peaks = [(x[i], height, fwhm, shape)]
+
+    offset, peaks = guess_peaks(x, y, peaks, offset)
+
+    para = [offset]
+    for x0, height, fwhm, shape in peaks:
+        para += [x0, height, fwhm / FWHM_SIGMA if shape is gauss_shape else fwhm]
+    if not np.all(np.isfinite(para)):
+        return
+    return para
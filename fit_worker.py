@@ -0,0 +1,101 @@
+import multiprocessing
+import time
+
+from fitting import fit_curve
+
+# Default time limit of one fit in seconds
+DEFAULT_TIMEOUT = 10.0
+
+
+class FitWorker:
+    """
+    Run curve fitting in a worker process so that the Tk mainloop never blocks.
+    Only the newest request matters: a request submitted while a fit is running
+    replaces the waiting one, and the running fit is dropped when it finishes.
+    A fit running longer than the timeout (or superseded after grace seconds)
+    is killed together with its process.
+    poll() has to be called periodically, e.g. with after() of a Tk widget.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, grace=0.5) -> None:
+        self.timeout = timeout
+        self.grace = grace
+        self.pool = None
+        # (AsyncResult, start time, tag) of the fit in progress
+        self.running = None
+        # (args, tag) of the fit to start next
+        self.waiting = None
+
+    def submit(self, x, y, func_name, width_ratio=None, maxfev=None, tag=None):
+        """Request a fit. tag is returned with the result to identify it"""
+        self.waiting = ((x, y, func_name, width_ratio, maxfev), tag)
+
+        # Kill a slow fit that is already out of date
+        if self.running is not None and time.monotonic() - self.running[1] > self.grace:
+            self.cancel_running()
+
+        if self.running is None:
+            self.start_waiting()
+
+    def poll(self):
+        """
+        Check the fit in progress.
+        Returns (tag, status, result) when a fit of the newest request has ended,
+        where status is "done", "failed" or "timeout" and result is (para, cov)
+        """
+        if self.running is None:
+            self.start_waiting()
+            return
+
+        async_result, started, tag = self.running
+        if async_result.ready():
+            self.running = None
+            try:
+                result = async_result.get()
+            except Exception:
+                result = None
+
+            # Results of superseded requests are dropped
+            superseded = self.waiting is not None
+            self.start_waiting()
+            if superseded:
+                return
+            return (tag, "done" if result is not None else "failed", result)
+
+        if time.monotonic() - started > self.timeout:
+            self.cancel_running()
+            superseded = self.waiting is not None
+            self.start_waiting()
+            if not superseded:
+                return (tag, "timeout", None)
+
+    def discard(self):
+        """
+        Drop the waiting request. The result of the running fit is still
+        returned by poll(), its tag tells that it is out of date.
+        """
+        self.waiting = None
+
+    def busy(self):
+        return self.running is not None or self.waiting is not None
+
+    def start_waiting(self):
+        if self.waiting is None:
+            return
+        args, tag = self.waiting
+        self.waiting = None
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(processes=1)
+        self.running = (self.pool.apply_async(fit_curve, args), time.monotonic(), tag)
+
+    def cancel_running(self):
+        """Terminate the process of the fit in progress"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self.running = None
+
+    def close(self):
+        self.waiting = None
+        self.cancel_running()
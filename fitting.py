@@ -0,0 +1,222 @@
+import numpy as np
+
+from fit_guess import FWHM_SIGMA, detect_peaks, robust_guess
+from FitFunctions import Functions
+
+# Fit functions selectable in the GUI
+FIT_FUNCTIONS = {
+    "Lorentz": Functions.Lorentz,
+    "Gauss": Functions.Gauss,
+    "Fano": Functions.Fano,
+    "Gorodetsky": Functions.Gorodetsky,
+}
+
+# Analytic Jacobians of FIT_FUNCTIONS
+FIT_JACOBIANS = {
+    "Lorentz": Functions.Lorentz_jac,
+    "Gauss": Functions.Gauss_jac,
+    "Fano": Functions.Fano_jac,
+    "Gorodetsky": Functions.Gorodetsky_jac,
+}
+
+# Names of the fitted parameters stored in the metadata
+PARAMETER_NAMES = ["offset", "eigenfrequency", "amplitude", "linewidth"]
+
+# All parameters of each function
+FIT_PARAMETERS = {
+    "Lorentz": PARAMETER_NAMES,
+    "Gauss": PARAMETER_NAMES,
+    "Fano": PARAMETER_NAMES + ["q"],
+    # Mechanical peak (Lorentz) and calibration tone (Gauss) fitted together
+    "Gorodetsky": ["offset"]
+    + [f"Lorentz_{name}" for name in PARAMETER_NAMES[1:]]
+    + [f"Gauss_{name}" for name in PARAMETER_NAMES[1:]],
+}
+
+
+def initial_guess(x, y, func_name, width_ratio=None, robust=True):
+    """
+    Initial parameters for curve_fit.
+    Without width_ratio and with robust the peaks are found on smoothed data
+    and refined by a linearized pre-fit (fit_guess.py). Otherwise, or if that
+    fails, they are taken from the maximum and width_ratio of the range.
+    Without width_ratio the two peaks of Gorodetsky are still detected.
+    """
+    # An explicit width ratio is the width of the peak, as chosen by the user
+    explicit = width_ratio is not None
+    if robust and not explicit:
+        para = robust_guess(x, y, func_name)
+        if para is not None:
+            return para
+
+    if not explicit:
+        width_ratio = 0.5
+
+    # Mechanical Lorentzian and calibration tone (Gaussian)
+    if func_name in ("Lorentz", "Gauss"):
+        offset = 0.5 * (np.mean(y[:10]) + np.mean(y[-10:]))
+        height = np.nanmax(y) - offset
+        x0 = x[np.nanargmax(y)]
+        dx = (np.max(x) - np.min(x)) * width_ratio
+        return [offset, x0, height, dx]
+
+    # Optical resonance
+    elif func_name == "Fano":
+        offset = 0.5 * (np.mean(y[:5]) + np.mean(y[-5:]))
+        height = np.nanmin(y) - offset
+        x0 = x[np.nanargmin(y)]
+        dx = (np.max(x) - np.min(x)) * width_ratio
+        q = 0.1
+        return [offset, x0, height, dx, q]
+
+    # Mechanical Lorentzian and calibration tone in the same range
+    elif func_name == "Gorodetsky":
+        offset = 0.5 * (np.mean(y[:10]) + np.mean(y[-10:]))
+        peaks = [] if explicit else detect_peaks(x, y, offset, n_peaks=2)
+        if len(peaks) == 2:
+            # Same choice of the tone as fit_guess.robust_guess
+            tone, mech = sorted(peaks, key=lambda peak: peak[2])
+            sigma = tone[2] / FWHM_SIGMA
+            return [offset, x[mech[0]], mech[1], mech[2], x[tone[0]], tone[1], sigma]
+
+        dx = (np.max(x) - np.min(x)) * width_ratio
+        # The tone is the highest peak, the mechanical peak the highest point
+        # outside the width around it
+        tone = np.nanargmax(y)
+        outside = np.abs(x - x[tone]) > dx
+        mech = np.nanargmax(np.where(outside, y, np.nan)) if outside.any() else tone
+        sigma = dx / FWHM_SIGMA
+        return [offset, x[mech], y[mech] - offset, dx, x[tone], y[tone] - offset, sigma]
+
+
+def fit_curve(
+    x, y, func_name, width_ratio=None, maxfev=None, use_jac=True, robust=True
+):
+    """
+    Fit (x, y) with one of FIT_FUNCTIONS.
+    With use_jac the analytic Jacobian is used instead of finite differences,
+    robust selects the initial guess (see initial_guess).
+    Returns (para, cov), or None when the fit has failed.
+    """
+    if func_name not in FIT_FUNCTIONS:
+        return
+
+    # scipy.optimize is imported on the first fit, not at the start of the GUI
+    from scipy.optimize import curve_fit
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    # e.g. an empty range of the sliders
+    if len(x) < len(FIT_PARAMETERS[func_name]):
+        return
+
+    try:
+        p0 = initial_guess(x, y, func_name, width_ratio, robust=robust)
+    except (ValueError, IndexError, ArithmeticError):
+        return
+
+    kwargs = {}
+    if maxfev is not None:
+        kwargs["maxfev"] = maxfev
+    if use_jac:
+        kwargs["jac"] = FIT_JACOBIANS[func_name]
+
+    try:
+        para, cov = curve_fit(FIT_FUNCTIONS[func_name], x, y, p0=p0, **kwargs)
+    except (RuntimeError, ValueError, TypeError):
+        return
+
+    return para, cov
+
+
+def make_fit_dict(func_name, para):
+    """Fitted parameters with the keys stored in the metadata"""
+    if func_name == "Gorodetsky":
+        # Same keys as separate Lorentz and Gauss fits, e.g. for g0
+        fit_dict = dict(zip(FIT_PARAMETERS[func_name][1:], para[1:]))
+        fit_dict["Lorentz_offset"] = fit_dict["Gauss_offset"] = para[0]
+        return fit_dict
+    return {f"{func_name}_{name}": value for name, value in zip(PARAMETER_NAMES, para)}
+
+
+def fit_stacked(
+    x, Y, func_name, width_ratio=None, max_iter=200, ftol=1.5e-8, xtol=1.5e-8
+):
+    """
+    Fit N spectra on the same grid at once with a vectorized Levenberg-Marquardt.
+    x has shape (M,) and Y (N, M). Initial guesses are the same as fit_curve.
+    Returns para (N, P), cov (N, P, P) and a boolean array of converged rows.
+    """
+    func = FIT_FUNCTIONS[func_name]
+    jac_func = FIT_JACOBIANS[func_name]
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    Y = np.ascontiguousarray(np.atleast_2d(Y), dtype=np.float64)
+    n_spectra, n_points = Y.shape
+
+    para = np.array([initial_guess(x, y, func_name, width_ratio) for y in Y])
+    n_para = para.shape[1]
+    identity = np.eye(n_para)
+
+    def residual(p, rows):
+        return Y[rows] - func(x, *(p[:, k, None] for k in range(n_para)))
+
+    rows = np.arange(n_spectra)
+    r = residual(para, rows)
+    cost = np.sum(r**2, axis=1)
+    damping = np.full(n_spectra, 1e-3)
+    converged = np.zeros(n_spectra, dtype=bool)
+    active = np.ones(n_spectra, dtype=bool)
+
+    for _ in range(max_iter):
+        rows = np.flatnonzero(active)
+        if len(rows) == 0:
+            break
+
+        p = para[rows]
+        J = jac_func(x, *(p[:, k, None] for k in range(n_para)))
+        JT = J.transpose(0, 2, 1)
+        g = (JT @ r[rows][:, :, None])[:, :, 0]
+        A_scaled, scale = _scaled_normal_matrix(JT @ J)
+        lhs = A_scaled + damping[rows, None, None] * identity
+        try:
+            step = np.linalg.solve(lhs, (g / scale)[:, :, None])[:, :, 0] / scale
+        except np.linalg.LinAlgError:
+            step = np.einsum("npq,nq->np", np.linalg.pinv(lhs), g / scale) / scale
+
+        p_new = p + step
+        r_new = residual(p_new, rows)
+        cost_new = np.sum(r_new**2, axis=1)
+
+        # Accept improving steps and adapt damping for each spectrum separately
+        improved = cost_new < cost[rows]
+        accepted = rows[improved]
+        small_step = np.all(np.abs(step) <= xtol * (np.abs(p) + xtol), axis=1)
+        done = (improved & (cost[rows] - cost_new <= ftol * cost[rows])) | small_step
+        para[accepted] = p_new[improved]
+        r[accepted] = r_new[improved]
+        cost[accepted] = cost_new[improved]
+        damping[rows] = np.where(improved, damping[rows] / 10, damping[rows] * 10)
+
+        converged[rows[done]] = True
+        # Stop when converged or when no step improves the fit anymore
+        active[rows[done | (damping[rows] > 1e16)]] = False
+
+    # Covariance as curve_fit with absolute_sigma=False
+    J = jac_func(x, *(para[:, k, None] for k in range(n_para)))
+    A_scaled, scale = _scaled_normal_matrix(J.transpose(0, 2, 1) @ J)
+    dof = max(n_points - n_para, 1)
+    cov = np.linalg.pinv(A_scaled) / scale[:, :, None] / scale[:, None, :]
+    cov *= (cost / dof)[:, None, None]
+
+    return para, cov, converged
+
+
+def _scaled_normal_matrix(A):
+    """
+    Normalize J^T J by its diagonal (Marquardt scaling).
+    The parameters differ by many orders of magnitude (e.g. 1e-10 W and 1e9 Hz),
+    so the system is solved for parameters divided by scale.
+    """
+    scale = np.sqrt(np.einsum("npp->np", A))
+    scale[scale == 0] = 1
+    return A / scale[:, :, None] / scale[:, None, :], scale
@@ -0,0 +1,158 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import time
+
+from catalog import is_data_file
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def open_inotify(folder):
+    """Non-blocking inotify file descriptor watching the folder, None if unavailable"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return
+    if fd < 0:
+        return
+    if libc.inotify_add_watch(fd, os.fsencode(folder), WATCH_MASK) < 0:
+        os.close(fd)
+        return
+    return fd
+
+
+class FolderWatcher:
+    """
+    Report data files which are added to, changed in or removed from a folder.
+    Uses inotify where available, so only the files named by an event are looked
+    at; otherwise the folder listing is compared every `interval` seconds.
+    A file is reported once its size and mtime have not changed for `settle`
+    seconds, so files still being written by the acquisition are skipped.
+    poll() has to be called periodically, e.g. with after() of a Tk widget.
+    """
+
+    def __init__(self, folder, settle=1.0, interval=2.0, use_inotify=True) -> None:
+        self.folder = folder
+        self.settle = settle
+        self.interval = interval
+        # name -> ((size, mtime), time of the last change) of files being written
+        self.pending = {}
+        self.removed = set()
+
+        self.fd = open_inotify(folder) if use_inotify else None
+        # Listing of the folder for polling
+        self.known = None if self.fd is not None else self.scan()
+        self.last_scan = time.monotonic()
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def scan(self):
+        found = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if is_data_file(entry.name) and (entry.is_file() or entry.is_dir()):
+                    stat = entry.stat()
+                    found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def stat(self, name):
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except FileNotFoundError:
+            return
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def poll(self):
+        """
+        Returns names of the files which are ready (new or changed)
+        and of the files which have been removed since the last call
+        """
+        now = time.monotonic()
+        if self.fd is not None:
+            for name in self.read_events():
+                self.touch(name, now)
+        elif now - self.last_scan >= self.interval:
+            self.last_scan = now
+            found = self.scan()
+            for name in found.keys() - self.known.keys():
+                self.touch(name, now)
+            for name in self.known.keys() - found.keys():
+                self.touch(name, now)
+            for name in found.keys() & self.known.keys():
+                if found[name] != self.known[name]:
+                    self.touch(name, now)
+            self.known = found
+
+        # Files whose size and mtime have settled
+        ready = []
+        for name, (stat, changed) in list(self.pending.items()):
+            if now - changed < self.settle:
+                continue
+            current = self.stat(name)
+            if current is None:
+                del self.pending[name]
+                self.removed.add(name)
+            elif current == stat:
+                del self.pending[name]
+                ready.append(name)
+            else:
+                self.pending[name] = (current, now)
+
+        removed = sorted(self.removed)
+        self.removed.clear()
+        return ready, removed
+
+    def touch(self, name, now):
+        """Restart the settle time of a file named by an event"""
+        stat = self.stat(name)
+        if stat is None:
+            self.pending.pop(name, None)
+            self.removed.add(name)
+        else:
+            self.pending[name] = (stat, now)
+            self.removed.discard(name)
+
+    def read_events(self):
+        """Names of the data files in the pending inotify events"""
+        names = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, look at the whole folder once
+                    names.update(self.scan())
+                name = os.fsdecode(name)
+                if is_data_file(name):
+                    names.add(name)
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,194 @@
+import numpy as np
+
+# Physical constants
+KB = 1.380649e-23
+PLANCK = 6.62607015e-34
+# Temperature of the lab (K)
+DEFAULT_TEMPERATURE = 273.15 + 21
+# Ratio of the modulation power reaching the EOM, if not in the metadata
+DEFAULT_POWER_LOSS = 1.34**-1
+
+# Metadata keys used for the calibration, in the order of estimate_g0
+G0_KEYS = [
+    "Lorentz_eigenfrequency",
+    "Lorentz_amplitude",
+    "Lorentz_linewidth",
+    "mod_frequency",
+    "Gauss_amplitude",
+    "ENBW",
+    "Vpi",
+    "mod_power_dBm",
+]
+# Metadata of the measurement needed for g0 besides the fit results
+CALIBRATION_KEYS = ["mod_frequency", "ENBW", "Vpi", "mod_power_dBm", "power_loss"]
+
+
+def modulation_depth(Vpi, mod_power_dBm, power_loss=DEFAULT_POWER_LOSS):
+    """Phase modulation depth beta of the EOM driven with mod_power_dBm (50 Ohm)"""
+    power = 10 ** (np.asarray(mod_power_dBm, dtype=np.float64) / 10) * 1e-3
+    V = np.sqrt(power_loss * power * 50) * np.sqrt(2)
+    return V / Vpi * np.pi
+
+
+def thermal_occupation(freq, temperature=DEFAULT_TEMPERATURE):
+    """Mean phonon number of a mode at freq (Hz)"""
+    return 1.0 / np.expm1(
+        PLANCK * np.asarray(freq, dtype=np.float64) / (KB * temperature)
+    )
+
+
+def estimate_g0(
+    mech_freq,
+    mech_height,
+    gamma,
+    mod_freq,
+    mod_height,
+    ENBW,
+    Vpi,
+    mod_power_dBm,
+    power_loss=DEFAULT_POWER_LOSS,
+    temperature=DEFAULT_TEMPERATURE,
+):
+    """
+    g0/2pi (Hz) by comparing the thermal mechanical peak (Lorentz fit) with a
+    calibration tone of known phase modulation (Gauss fit).
+    All arguments may be arrays of the same shape (or broadcastable) to
+    calibrate a whole sweep at once.
+    """
+    beta = modulation_depth(Vpi, mod_power_dBm, power_loss)
+    nth = thermal_occupation(mech_freq, temperature)
+    # gamma should be expressed in angular frequency so it's multiplied by 2pi while ENBW is in direct frequency.
+    return np.sqrt(
+        0.5
+        / nth
+        * (beta**2)
+        * (np.abs(mod_freq) ** 2)
+        / 2
+        * np.abs(mech_height)
+        * np.abs(gamma)
+        * 2
+        * np.pi
+        / 4
+        / (np.abs(mod_height) * ENBW)
+    )
+
+
+def g0_error(
+    g0,
+    mech_freq,
+    mech_height,
+    gamma,
+    mod_height,
+    lorentz_cov=None,
+    gauss_cov=None,
+    joint_cov=None,
+    temperature=DEFAULT_TEMPERATURE,
+):
+    """
+    Standard error of g0 from the covariances of the Lorentz and Gauss fits,
+    shape (..., 4, 4) in the order of fitting.PARAMETER_NAMES, or of the joint
+    Gorodetsky fit (..., 7, 7). The Lorentz and Gauss fits are independent,
+    a missing covariance counts as exact.
+    """
+    mech_freq = np.asarray(mech_freq, dtype=np.float64)
+    variance = np.zeros(np.broadcast(g0, mech_freq).shape)
+
+    # Gradients of log(g0) with respect to offset, eigenfrequency, amplitude, linewidth
+    x = PLANCK * mech_freq / (KB * temperature)
+    lorentz_grad = np.stack(
+        np.broadcast_arrays(
+            0.0,
+            0.5 * PLANCK / (KB * temperature) * (1 + 1 / np.expm1(x)),
+            0.5 / np.asarray(mech_height, dtype=np.float64),
+            0.5 / np.asarray(gamma, dtype=np.float64),
+        ),
+        axis=-1,
+    )
+    # Only the amplitude of the calibration tone enters g0
+    gauss_grad = np.stack(
+        np.broadcast_arrays(
+            0.0, 0.0, -0.5 / np.asarray(mod_height, dtype=np.float64), 0.0
+        ),
+        axis=-1,
+    )
+
+    for grad, cov in [
+        (lorentz_grad, lorentz_cov),
+        (gauss_grad, gauss_cov),
+        # Both peaks share the offset in the joint fit
+        (np.concatenate([lorentz_grad, gauss_grad[..., 1:]], axis=-1), joint_cov),
+    ]:
+        if cov is not None:
+            variance = variance + np.einsum("...i,...ij,...j->...", grad, cov, grad)
+
+    return np.abs(g0) * np.sqrt(variance)
+
+
+def g0_table(
+    table,
+    temperature=DEFAULT_TEMPERATURE,
+    lorentz_cov=None,
+    gauss_cov=None,
+    joint_cov=None,
+):
+    """
+    g0 and its standard error for each row of a table of metadata, e.g. one row
+    per file of a sweep. Columns are G0_KEYS, optionally power_loss and the
+    covariances Lorentz_covariance and Gauss_covariance (4x4 per row), or
+    Gorodetsky_covariance (7x7) of the joint fit.
+    Covariances can also be given as (N, P, P) arrays, which is faster.
+    Returns a copy of the table with the columns g0 and g0_err added,
+    g0_err is NaN without covariances.
+    """
+    import pandas as pd
+
+    table = pd.DataFrame(table).copy()
+    values = [table[key].to_numpy(dtype=np.float64) for key in G0_KEYS]
+    if "power_loss" in table:
+        power_loss = table["power_loss"].to_numpy(dtype=np.float64)
+        power_loss = np.where(np.isnan(power_loss), DEFAULT_POWER_LOSS, power_loss)
+    else:
+        power_loss = DEFAULT_POWER_LOSS
+
+    g0 = estimate_g0(*values, power_loss=power_loss, temperature=temperature)
+    table["g0"] = g0
+
+    if lorentz_cov is None:
+        lorentz_cov = stack_covariance(table.get("Lorentz_covariance"), len(table))
+    if gauss_cov is None:
+        gauss_cov = stack_covariance(table.get("Gauss_covariance"), len(table))
+    if joint_cov is None:
+        joint_cov = stack_covariance(
+            table.get("Gorodetsky_covariance"), len(table), size=7
+        )
+    if lorentz_cov is None and gauss_cov is None and joint_cov is None:
+        table["g0_err"] = np.nan
+    else:
+        table["g0_err"] = g0_error(
+            g0,
+            values[0],
+            values[1],
+            values[2],
+            values[4],
+            lorentz_cov=lorentz_cov,
+            gauss_cov=gauss_cov,
+            joint_cov=joint_cov,
+            temperature=temperature,
+        )
+    return table
+
+
+def stack_covariance(column, n_rows, size=4):
+    """(N, size, size) array of a column of covariances, NaN where missing"""
+    if column is None:
+        return
+    try:
+        return np.stack(list(column)).astype(np.float64).reshape(n_rows, size, size)
+    except (TypeError, ValueError):
+        pass
+
+    stacked = np.full((n_rows, size, size), np.nan)
+    for i, cov in enumerate(column):
+        if cov is not None and np.shape(cov) == (size, size):
+            stacked[i] = cov
+    return stacked
@@ -3,16 +3,31 @@ import tkinter as tk
 
 import customtkinter
 import numpy as np
-import pandas as pd
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 
+from catalog import FolderCatalog
+from data_cache import load_metadata
+from data_io import is_own_write
+from file_list import VirtualFileList
+from fit_cache import fit_key, shared_fit_cache
+from fit_worker import DEFAULT_TIMEOUT, FitWorker
+from folder_watch import FolderWatcher
+from gorodetsky import DEFAULT_POWER_LOSS, DEFAULT_TEMPERATURE, G0_KEYS, g0_error
+from mode_fit import MODE_FUNCTIONS
 from plot_control import PlotControl
+from prefetch import Prefetcher
 
 path_cur = os.path.dirname(os.path.realpath(__file__))
 os.chdir(path_cur)
 
 
 FONT_TYPE = "Helvetica"
+# Interval to check the fit worker (ms)
+FIT_POLL_MS = 50
+# Interval to check the watched folder (ms)
+WATCH_POLL_MS = 500
+# Delay after the window is shown to import the modules deferred at startup (ms)
+PRELOAD_MS = 200
 
 
 class App(customtkinter.CTk):
@@ -23,10 +38,22 @@ class App(customtkinter.CTk):
         # Member variables
         self.fonts = (FONT_TYPE, 15)
         self.data_filepath = None
+        # Files next to the shown one are read in the background
+        self.prefetcher = Prefetcher()
 
         # Setup form
         self.setup_form()
 
+        # Browse the file list with the arrow keys
+        self.bind("<Down>", lambda event: self.step_file(event, 1))
+        self.bind("<Up>", lambda event: self.step_file(event, -1))
+
+        # Write back fit results before closing
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        # Import pandas and scipy once the window is shown
+        self.after(PRELOAD_MS, preload_modules)
+
     def setup_form(self):
         # Form design of CustomTkinter
         customtkinter.set_appearance_mode(
@@ -64,6 +91,36 @@ class App(customtkinter.CTk):
             self.data_filepath = data_filepath
         self.plot_main_frame.update(data_filepath=self.data_filepath)
 
+        if data_filepath is not None:
+            self.prefetcher.request(
+                self.file_select.file_list.neighbours(
+                    data_filepath, self.prefetcher.depth
+                )
+            )
+
+    def step_file(self, event, n):
+        # Arrow keys keep their meaning in text entries
+        if isinstance(event.widget, tk.Entry):
+            return
+        self.file_select.step_file(n)
+
+    def on_closing(self):
+        self.file_select.stop_watch()
+        self.prefetcher.close()
+        self.plot_main_frame.plot_control.commit_fit(commit_all=True)
+        self.plot_main_frame.fit_worker.close()
+        shared_fit_cache.close()
+        self.destroy()
+
+
+def preload_modules():
+    """
+    Import the modules deferred at startup, before the first file is read.
+    The fit worker is forked from this process and does not import them again.
+    """
+    import pandas
+    import scipy.optimize
+
 
 class FileSelect(customtkinter.CTkFrame):
     def __init__(self, *args, **kwargs):
@@ -72,12 +129,16 @@ class FileSelect(customtkinter.CTkFrame):
         self.fonts = (FONT_TYPE, 15)
 
         self.curr_path = None
+        # Index of the files in the current folder
+        self.catalog = None
+        # Reports files added by the acquisition while watching
+        self.watcher = None
 
         self.setup_form()
 
     def setup_form(self):
         # Resize configuration
-        self.grid_rowconfigure(1, weight=1)
+        self.grid_rowconfigure(2, weight=1)
         self.grid_columnconfigure((0, 1, 2), weight=0)
 
         # Variable to store the selected file
@@ -95,55 +156,144 @@ class FileSelect(customtkinter.CTkFrame):
         )
         self.update_folder_button.grid(row=0, column=1, padx=5, pady=5, sticky="ns")
 
-        # Scrollable frame for displaying files
-        self.scrollable_frame = customtkinter.CTkScrollableFrame(master=self, width=300)
-        self.scrollable_frame.grid(
-            row=1, column=0, columnspan=2, padx=5, pady=10, sticky="ns"
+        # Filter files by metadata, e.g. "Lorentz_linewidth < 5e3"
+        self.entry_filter = customtkinter.CTkEntry(
+            master=self, placeholder_text="Filter: key < value and ..."
+        )
+        self.entry_filter.grid(row=1, column=0, columnspan=2, padx=5, sticky="ew")
+        self.entry_filter.bind("<Return>", self.filter_files)
+
+        # List of files, only visible rows are created
+        self.file_list = VirtualFileList(
+            master=self, mode="radio", variable=self.selected_file, width=300
         )
+        self.file_list.grid(row=2, column=0, columnspan=2, padx=5, pady=10, sticky="ns")
 
         # Process button
         self.process_button = customtkinter.CTkButton(
             master=self, text="Plot!!", command=self.process_file
         )
-        self.process_button.grid(row=2, column=0, padx=5, pady=5, sticky="ns")
+        self.process_button.grid(row=3, column=0, padx=5, pady=5, sticky="ns")
+
+        # Watch the folder for files written by the acquisition
+        self.check_watch = customtkinter.CTkCheckBox(
+            master=self, text="Watch folder", command=self.toggle_watch
+        )
+        self.check_watch.grid(row=4, column=0, padx=5, pady=5, sticky="w")
+
+        # Plot (and fit) the newest file while watching
+        self.check_auto_plot = customtkinter.CTkCheckBox(master=self, text="Auto plot")
+        self.check_auto_plot.grid(row=4, column=1, padx=5, pady=5, sticky="w")
 
     def select_folder(self):
         folder_path = tk.filedialog.askdirectory()
         if folder_path:
             self.display_data_files(folder_path)
             self.curr_path = folder_path
+            if self.check_watch.get():
+                self.start_watch()
 
     def update_folder(self):
         if self.curr_path is not None:
             self.display_data_files(self.curr_path)
 
-    def display_data_files(self, folder_path):
-        # Clear the scrollable frame
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
-        # Get all data files
-        data_files = [
-            f
-            for f in os.listdir(folder_path)
-            if f.endswith(".pickle") or f.endswith(".h5")
-        ]
-
-        # Display files in the scrollable frame with radio buttons
-        if data_files:
-            for file in data_files:
-                radio_button = customtkinter.CTkRadioButton(
-                    self.scrollable_frame,
-                    text=file,
-                    variable=self.selected_file,
-                    value=os.path.join(folder_path, file),
+    def filter_files(self, event=None):
+        if self.curr_path is not None:
+            self.display_data_files(self.curr_path)
+
+    def display_data_files(self, folder_path, refresh=True):
+        # Only new or modified files are read to update the index
+        if self.catalog is None or self.catalog.folder != folder_path:
+            if self.catalog is not None:
+                self.catalog.close()
+            self.catalog = FolderCatalog(folder_path)
+            refresh = True
+        if refresh:
+            self.catalog.refresh()
+
+        # Files matching the filter, answered from the index without reading them
+        expression = self.entry_filter.get().strip()
+        try:
+            names = (
+                self.catalog.query(expression) if expression else self.catalog.names()
+            )
+        except ValueError as e:
+            tk.messagebox.showinfo("Invalid filter", str(e))
+            names = self.catalog.names()
+
+        # Display files in the list with radio buttons
+        self.file_list.set_items(folder_path, names)
+
+    def toggle_watch(self):
+        if self.check_watch.get():
+            self.start_watch()
+        else:
+            self.stop_watch()
+
+    def start_watch(self):
+        self.stop_watch()
+        if self.curr_path is None:
+            return
+
+        self.watcher = FolderWatcher(self.curr_path)
+        # Files added before the watch started
+        self.display_data_files(self.curr_path)
+        self.after(WATCH_POLL_MS, self.poll_watch, self.watcher)
+
+    def stop_watch(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    def poll_watch(self, watcher):
+        """Add files reported by the watcher, only these files are read"""
+        # Watcher of a previous folder
+        if watcher is not self.watcher:
+            return
+
+        ready, removed = watcher.poll()
+        if ready or removed:
+            added, changed, removed = self.catalog.update(ready + removed)
+            self.show_changed_files(added + changed, removed)
+
+            # Only new files, saving a fit changes the file that was plotted before
+            added = [
+                name for name in added if not is_own_write(self.file_list.path(name))
+            ]
+            if added and self.check_auto_plot.get():
+                newest = max(
+                    added,
+                    key=lambda name: os.path.getmtime(self.file_list.path(name)),
                 )
-                radio_button.pack(fill="x", pady=2, padx=5)
+                self.selected_file.set(self.file_list.path(newest))
+                self.process_file()
+
+        self.after(WATCH_POLL_MS, self.poll_watch, watcher)
+
+    def show_changed_files(self, changed, removed):
+        expression = self.entry_filter.get().strip()
+        if expression:
+            # Changed files may no longer match the filter
+            self.display_data_files(self.curr_path, refresh=False)
         else:
-            no_files_label = customtkinter.CTkLabel(
-                self.scrollable_frame, text="No .pickle or h5 file found in the folder."
-            )
-            no_files_label.pack(pady=10)
+            self.file_list.remove_items(removed)
+            self.file_list.add_items(changed)
+
+    def step_file(self, n):
+        """Plot the file n rows below (above if negative) the selected one"""
+        file_list = self.file_list
+        index = file_list.index(self.selected_file.get())
+        if index is None:
+            return
+
+        new_index = min(max(index + n, 0), len(file_list.names) - 1)
+        if new_index == index:
+            return
+
+        index = new_index
+        file_list.see(index)
+        self.selected_file.set(file_list.path(file_list.names[index]))
+        self.process_file()
 
     def process_file(self):
         # selected = self.selected_file.get()
@@ -165,6 +315,11 @@ class PlotMainFrame(customtkinter.CTkFrame):
         self.header_name = header_name
         # Import plot function from external file
         self.plot_control = PlotControl()
+        # Fitting runs in a worker process
+        self.fit_worker = FitWorker()
+        self.polling = False
+        # Key of the newest fit request, older results are not shown
+        self.fit_key = None
 
         self.data_pathname = None
 
@@ -209,26 +364,130 @@ class PlotMainFrame(customtkinter.CTkFrame):
         )
 
     def update(self, data_filepath=None, config=None, fit_config=None):
-        """Update fit curve"""
-        fit_config = {}
-        fit_config["FitFunc"] = self.range_frame.get_func()
-        try:
-            fit_config["WidthRatio"] = float(self.range_frame.entry_width.get())
-        except:
-            fit_config["WidthRatio"] = None
+        """Update plot and request fit curve"""
+        fit_config = self.range_frame.get_fit_config()
+        # Fits requested for the previous plot are not shown
+        self.drop_fit()
 
-        # Get fitting parameters if fitted
+        # Plot data, fitting is done by the worker process
         try:
-            fit_dict = self.plot_control.replot(
-                data_filepath, config, fit_config
-            )  # Return fitted parameters
+            self.plot_control.replot(data_filepath, config, fit_config, fit=False)
         except:
-            fit_dict = None
+            pass
 
-        self.canvas.draw()
+        # Redraw when Tk is idle, consecutive updates are drawn only once
+        self.canvas.draw_idle()
         self.toolbar.update()
-        self.meta_frame.update(data_filepath=data_filepath, fit_dict=fit_dict)
-        self.range_frame.g0_window(data_filepath=data_filepath, fit_dict=fit_dict)
+
+        if data_filepath is not None:
+            self.show_metadata()
+        self.request_fit()
+
+    def request_fit(self):
+        """Send data in the plot range to the fit worker"""
+        func_name = self.plot_control.fit_config["FitFunc"]
+        if func_name is None or func_name == "None":
+            self.drop_fit()
+            return
+        # e.g. a slider moved before a file is selected
+        if self.plot_control.filepath is None:
+            self.drop_fit()
+            return
+
+        x, y = self.plot_control.fit_data()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        width_ratio = self.plot_control.fit_config["WidthRatio"]
+        maxfev = self.plot_control.fit_config["MaxFev"]
+        key = fit_key(
+            x, y, func_name, width_ratio, maxfev, bounds=self.plot_control.fit_range
+        )
+        self.fit_key = key
+
+        # Ranges fitted before are shown at once, a fit still running is dropped
+        result = shared_fit_cache.get(key)
+        if result is not None:
+            self.fit_worker.discard()
+            self.plot_control.apply_fit(func_name, result[0], x, cov=result[1])
+            self.canvas.draw_idle()
+            self.show_metadata()
+            self.range_frame.show_fit_status(f"{func_name} fit cached")
+            return
+
+        self.fit_worker.timeout = self.range_frame.get_timeout()
+        self.fit_worker.submit(
+            x,
+            y,
+            func_name,
+            width_ratio=width_ratio,
+            maxfev=maxfev,
+            tag=(self.plot_control.filepath, func_name, x, key),
+        )
+        self.range_frame.show_fit_status("fitting...")
+
+        if not self.polling:
+            self.polling = True
+            self.after(FIT_POLL_MS, self.poll_fit)
+
+    def drop_fit(self):
+        """Results of the fits requested so far are not shown nor recorded"""
+        self.fit_key = None
+        self.fit_worker.discard()
+        self.range_frame.show_fit_status("")
+
+    def poll_fit(self):
+        """Check the fit worker and show the result in the Tk mainloop"""
+        finished = self.fit_worker.poll()
+        if finished is not None:
+            (filepath, func_name, x, key), status, result = finished
+            if status == "done":
+                shared_fit_cache.put(key, result)
+            # Discard results of a file or range that is no longer shown
+            if filepath == self.plot_control.filepath and key == self.fit_key:
+                if status == "done":
+                    self.plot_control.apply_fit(func_name, result[0], x, cov=result[1])
+                    self.canvas.draw_idle()
+                    self.show_metadata()
+                self.range_frame.show_fit_status(f"{func_name} fit {status}")
+
+        if self.fit_worker.busy():
+            self.after(FIT_POLL_MS, self.poll_fit)
+        else:
+            self.polling = False
+
+    def show_metadata(self):
+        """Show metadata including fit results not written to the file yet"""
+        data_filepath = self.plot_control.filepath
+        # Metadata is read once for both frames
+        attrs = load_metadata(data_filepath) if data_filepath is not None else None
+        if attrs is not None:
+            attrs.update(self.plot_control.pending_fit.get(data_filepath, {}))
+        self.meta_frame.update(attrs)
+        self.range_frame.g0_window(attrs, self.plot_control.fit_cov)
+
+    def commit_fit(self):
+        """Write fit results to the file"""
+        self.plot_control.commit_fit()
+
+    def fit_modes(self):
+        """Fit all modes in the plot range and export the mode table"""
+        if self.plot_control.filepath is None:
+            return
+        # Sums of Lorentz or Gauss peaks, Lorentz for the other functions
+        func_name = self.range_frame.get_func()
+        if func_name not in MODE_FUNCTIONS:
+            func_name = "Lorentz"
+
+        table = self.plot_control.fit_modes(
+            func_name, threshold=self.range_frame.get_threshold()
+        )
+        self.canvas.draw_idle()
+        filepath = self.plot_control.save_modes(table)
+        self.range_frame.show_fit_status(f"{len(table)} modes")
+        if filepath is not None:
+            tk.messagebox.showinfo(
+                "Success", f"{len(table)} modes exported to {filepath}"
+            )
 
     def button_save_callback(self):
         """
@@ -252,7 +511,6 @@ class MetaFrame(customtkinter.CTkScrollableFrame):
         # Copy config of plog
         self.plot_config = plot_config.copy()
         self.fit_config = fit_config.copy()
-        self.plot_control = PlotControl()
         # Setup form
         self.setup_form()
 
@@ -269,17 +527,16 @@ class MetaFrame(customtkinter.CTkScrollableFrame):
         )
         self.cell.grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky="nwes")
 
-    def update(self, data_filepath=None, fit_dict=None):
-        df = self.plot_control.get_dataframe(data_filepath)
-
-        if df is not None:
+    def update(self, attrs=None):
+        # Metadata including fit results not written to the file yet
+        if attrs is not None:
             for widget in self.winfo_children():
                 widget.destroy()
 
-            for i in np.arange(len(list(df.attrs.keys()))):
+            for i in np.arange(len(list(attrs.keys()))):
                 cell = customtkinter.CTkLabel(
                     self,
-                    text=list(df.attrs.keys())[i],
+                    text=list(attrs.keys())[i],
                     anchor="center",
                     # width=150,
                     # height=30,
@@ -287,7 +544,7 @@ class MetaFrame(customtkinter.CTkScrollableFrame):
                 cell.grid(row=i, column=0, padx=5, pady=5, sticky="nwes")
                 cell = customtkinter.CTkLabel(
                     self,
-                    text=df.attrs[list(df.attrs.keys())[i]],
+                    text=attrs[list(attrs.keys())[i]],
                     anchor="center",
                     # width=150,
                     # height=30,
@@ -311,8 +568,8 @@ class PlotRange(customtkinter.CTkFrame):
 
         self.fonts = (FONT_TYPE, 15)
         self.header_name = header_name
-        # Import plot function from external file
-        self.plot_control = PlotControl()
+        # PlotControl of the main frame, used for g0
+        self.plot_control = self.master.plot_control
         self.plot_config = plot_config.copy()
         self.fit_config = fit_config.copy()
         self.data_pathname = data_pathname
@@ -370,7 +627,7 @@ class PlotRange(customtkinter.CTkFrame):
         self.combo_func = customtkinter.CTkComboBox(
             self,
             font=self.fonts,
-            values=["None", "Lorentz", "Gauss", "Fano"],
+            values=["None", "Lorentz", "Gauss", "Fano", "Gorodetsky"],
             command=None,
         )
         self.combo_func.grid(row=2, rowspan=1, column=1, padx=10, pady=10, sticky="we")
@@ -381,12 +638,49 @@ class PlotRange(customtkinter.CTkFrame):
         )
         self.entry_width.grid(row=2, column=2)
 
+        # Entries for limits of the fit
+        self.entry_maxfev = customtkinter.CTkEntry(self, placeholder_text="maxfev")
+        self.entry_maxfev.grid(row=2, column=3, padx=5)
+        self.entry_timeout = customtkinter.CTkEntry(
+            self, placeholder_text=f"timeout {DEFAULT_TIMEOUT:g} s"
+        )
+        self.entry_timeout.grid(row=2, column=4, padx=5)
+
+        # Write fit results to the file
+        self.button_commit = customtkinter.CTkButton(
+            self, text="Save fit", command=self.commit_fit
+        )
+        self.button_commit.grid(row=3, column=2, padx=10, pady=10)
+
+        # Status of the fit worker
+        self.fit_status = customtkinter.CTkLabel(self, text="")
+        self.fit_status.grid(row=3, column=3, columnspan=2, padx=10, pady=10)
+
         # Text to show Gorodetsky
         self.text_Gor = customtkinter.CTkLabel(self, text="Gorodetsky")
         self.text_Gor.grid(row=3, column=0, pady=10)
         self.Gor_result = customtkinter.CTkLabel(self, text="")
         self.Gor_result.grid(row=3, column=1, padx=0, pady=0)
 
+        # Temperature of the mechanical mode for g0
+        self.entry_temperature = customtkinter.CTkEntry(
+            self, placeholder_text=f"temperature {DEFAULT_TEMPERATURE:g} K"
+        )
+        self.entry_temperature.grid(row=4, column=0, padx=10, pady=10)
+        self.entry_temperature.bind(
+            "<Return>", lambda event: self.master.show_metadata()
+        )
+
+        # Fit every peak in the range above the threshold (default from the noise)
+        self.button_modes = customtkinter.CTkButton(
+            self, text="Fit all modes", command=self.fit_modes
+        )
+        self.button_modes.grid(row=4, column=1, padx=10, pady=10)
+        self.entry_threshold = customtkinter.CTkEntry(
+            self, placeholder_text="threshold"
+        )
+        self.entry_threshold.grid(row=4, column=2, padx=5)
+
     def slider_upper(self, value):
         old_label = self.slider_label_upper.cget("text")
         new_label = f"Upper limit {value:.2f}"
@@ -405,6 +699,46 @@ class PlotRange(customtkinter.CTkFrame):
             self.plot_config["lower"] = value
             self.master.update(config=self.plot_config)
 
+    def commit_fit(self):
+        self.master.commit_fit()
+
+    def fit_modes(self):
+        self.master.fit_modes()
+
+    def get_fit_config(self):
+        fit_config = {}
+        fit_config["FitFunc"] = self.get_func()
+        try:
+            fit_config["WidthRatio"] = float(self.entry_width.get())
+        except:
+            fit_config["WidthRatio"] = None
+        try:
+            fit_config["MaxFev"] = int(self.entry_maxfev.get())
+        except:
+            fit_config["MaxFev"] = None
+        return fit_config
+
+    def get_timeout(self):
+        try:
+            return float(self.entry_timeout.get())
+        except:
+            return DEFAULT_TIMEOUT
+
+    def get_temperature(self):
+        try:
+            return float(self.entry_temperature.get())
+        except:
+            return DEFAULT_TEMPERATURE
+
+    def get_threshold(self):
+        try:
+            return float(self.entry_threshold.get())
+        except:
+            return
+
+    def show_fit_status(self, text):
+        self.fit_status.configure(text=text)
+
     def get_func(self):
         if self.combo_func is not None:
             # self.fit_config['FitFunc'] = self.combo_func.get()
@@ -413,50 +747,39 @@ class PlotRange(customtkinter.CTkFrame):
         return
 
     # Below is to show g0
-    def g0_window(self, data_filepath=None, fit_dict=None):
-        for widget in self.Gor_result.winfo_children():
-            widget.destroy()
-
-        df = self.plot_control.get_dataframe(data_filepath)
-        if df is None:
+    def g0_window(self, attrs=None, fit_cov=None):
+        """g0 of the fit results in attrs, with its error if the covariances are known"""
+        if attrs is None or any(key not in attrs for key in G0_KEYS):
+            self.Gor_result.configure(text="")
             return
 
-        if "Lorentz_offset" in df.attrs:
-            if "Gauss_offset" in df.attrs:
-                # Get Gorodetsky result
-                mech_freq = df.attrs["Lorentz_eigenfrequency"]
-                mech_height = df.attrs["Lorentz_amplitude"]
-                gamma = df.attrs["Lorentz_linewidth"]
-                mod_freq = df.attrs["mod_frequency"]
-                mod_height = df.attrs["Gauss_amplitude"]
-                ENBW = df.attrs["ENBW"]
-                Vpi = df.attrs["Vpi"]
-                mod_power_dBm = df.attrs["mod_power_dBm"]
-                if "power_loss" in df.attrs:
-                    power_loss = df.attrs["power_loss"]
-                else:
-                    power_loss = 1.34**-1
-
-                g0 = self.plot_control.estimate_g0(
-                    mech_freq,
-                    mech_height,
-                    gamma,
-                    mod_freq,
-                    mod_height,
-                    ENBW,
-                    Vpi,
-                    mod_power_dBm,
-                    power_loss,
-                )
+        # Get Gorodetsky result
+        g0 = self.plot_control.estimate_g0(
+            *(attrs[key] for key in G0_KEYS),
+            power_loss=attrs.get("power_loss", DEFAULT_POWER_LOSS),
+            temperature=self.get_temperature(),
+        )
+        text = f"g0/2pi [kHz] =  {g0*1e-3:.3f}"
 
-                self.Gor_result = customtkinter.CTkLabel(
-                    self, text=f"g0/2pi [kHz] =  {g0*1e-3:.3f}"
-                )
-                self.Gor_result.grid(row=3, column=1, padx=0, pady=0)
-            else:
-                return
-        else:
-            return
+        # Covariances of the fits done in this session
+        fit_cov = fit_cov or {}
+        separate = (
+            fit_cov.get("Lorentz") is not None and fit_cov.get("Gauss") is not None
+        )
+        if separate or fit_cov.get("Gorodetsky") is not None:
+            error = g0_error(
+                g0,
+                attrs["Lorentz_eigenfrequency"],
+                attrs["Lorentz_amplitude"],
+                attrs["Lorentz_linewidth"],
+                attrs["Gauss_amplitude"],
+                lorentz_cov=fit_cov.get("Lorentz"),
+                gauss_cov=fit_cov.get("Gauss"),
+                joint_cov=fit_cov.get("Gorodetsky"),
+                temperature=self.get_temperature(),
+            )
+            text += f" +/- {error*1e-3:.3f}"
+        self.Gor_result.configure(text=text)
 
 
 if __name__ == "__main__":
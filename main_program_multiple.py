@@ -3,6 +3,9 @@ import tkinter as tk
 import customtkinter
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from plot_control_multiple import PlotControl
+from plot_control_map import MapControl
+from catalog import FolderCatalog
+from file_list import VirtualFileList
 import pandas as pd
 import os
 path_cur = os.path.dirname(os.path.realpath(__file__))
@@ -67,18 +70,24 @@ class FileBox(customtkinter.CTkFrame):
         )
         self.select_folder_button.grid(row=0,column=0,pady=10)
 
-        # Frame for checkboxes
-        self.file_frame = customtkinter.CTkScrollableFrame(self, width=300, height=600)
-        self.file_frame.grid(row=1, column=0,pady=10, padx=20, sticky='ns')
+        # Filter files by metadata, e.g. "mod_power_dBm > -40"
+        self.entry_filter = customtkinter.CTkEntry(self, placeholder_text="Filter: key < value and ...")
+        self.entry_filter.grid(row=1, column=0, padx=20, sticky='ew')
+        self.entry_filter.bind("<Return>", lambda event: self.update_file_list())
+
+        # List of files with checkboxes, only visible rows are created
+        self.file_list = VirtualFileList(self, mode="check", width=300, height=600, command=self.toggle_file)
+        self.file_list.grid(row=2, column=0,pady=10, padx=20, sticky='ns')
 
         # Save selected files button
         self.save_button = customtkinter.CTkButton(
             self, text="Print Selected Files", command=self.print_selected_files
         )
-        self.save_button.grid(row=2,column=0,pady=10)
+        self.save_button.grid(row=3,column=0,pady=10)
 
-        self.file_checkboxes = {}
         self.folder_path = ""
+        # Index of the files in the current folder
+        self.catalog = None
 
     def select_folder(self):
         # Select folder dialog
@@ -88,37 +97,36 @@ class FileBox(customtkinter.CTkFrame):
         self.update_file_list()
 
     def update_file_list(self):
-        # Clear existing checkboxes
-        for widget in self.file_frame.winfo_children():
-            widget.destroy()
-
-        # List .pickle files in the selected folder
+        # Only new or modified files are read to update the index
         if self.folder_path:
-            pickle_files = [
-                f for f in os.listdir(self.folder_path) if f.endswith(".pickle") or f.endswith(".h5")
-            ]
+            if self.catalog is None or self.catalog.folder != self.folder_path:
+                if self.catalog is not None:
+                    self.catalog.close()
+                self.catalog = FolderCatalog(self.folder_path)
+            self.catalog.refresh()
+
+            # Files matching the filter, answered from the index without reading them
+            expression = self.entry_filter.get().strip()
+            try:
+                pickle_files = self.catalog.query(expression) if expression else self.catalog.names()
+            except ValueError as e:
+                tk.messagebox.showinfo("Invalid filter", str(e))
+                pickle_files = self.catalog.names()
             if not pickle_files:
                 tk.messagebox.showinfo("No Files", "No .pickle or .h5 file found in the folder.")
-            else:
-                for file in pickle_files:
-                    var = customtkinter.StringVar(value="off")
-                    checkbox = customtkinter.CTkCheckBox(
-                        self.file_frame, text=file, variable=var, onvalue="on", offvalue="off"
-                    )
-                    checkbox.pack(anchor="w", padx=10, pady=5)
-                    self.file_checkboxes[file] = var
+            self.file_list.set_items(self.folder_path, pickle_files)
+
+    def toggle_file(self):
+        # Once plotted, checking a file adds its curve without redrawing the others
+        if self.master.pickle_filepath is not None:
+            self.master.update_canvas(self.file_list.get_checked())
 
     def print_selected_files(self):
-        selected_files = [
-            file for file, var in self.file_checkboxes.items() if var.get() == "on"
-        ]
-        if selected_files:
-            print("Selected Files:", selected_files)
-            full_path = [ self.folder_path+'/'+x for x in selected_files ]
-            for file in full_path:
-                # pickle_filepath = self.selected_file.get()
-                # full_path = [ self.folder_path+'/'+x for x in file ]
-                self.master.update_canvas(full_path)
+        full_path = self.file_list.get_checked()
+        if full_path:
+            print("Selected Files:", [os.path.basename(x) for x in full_path])
+            # All selected files are plotted at once
+            self.master.update_canvas(full_path)
         else:
             print("No files selected.")
 
@@ -252,6 +260,21 @@ class PlotMainFrame(customtkinter.CTkFrame):
         self.button_save = customtkinter.CTkButton(master=self, command=self.button_save_callback, text="Save as .png", font=self.fonts)
         self.button_save.grid(row=1, column=1, padx=0, pady=20, sticky="s")   
 
+        # Fit all plotted curves at once
+        self.combo_func = customtkinter.CTkComboBox(self, font=self.fonts, values=["Lorentz", "Gauss", "Fano", "Gorodetsky"])
+        self.combo_func.grid(row=2, column=0, padx=20, pady=0, sticky="e")
+        self.button_fit = customtkinter.CTkButton(master=self, command=self.button_fit_callback, text="Fit all", font=self.fonts)
+        self.button_fit.grid(row=2, column=1, padx=0, pady=0, sticky="s")
+
+        # Color curves by a metadata value, e.g. mod_power_dBm
+        self.entry_color = customtkinter.CTkEntry(self, placeholder_text="Color by (metadata key)", width=200)
+        self.entry_color.grid(row=3, column=0, padx=20, pady=10, sticky="e")
+        self.entry_color.bind("<Return>", self.color_callback)
+
+        # Show the plotted files as a 2D map
+        self.button_map = customtkinter.CTkButton(master=self, command=self.button_map_callback, text="Show map", font=self.fonts)
+        self.button_map.grid(row=3, column=1, padx=0, pady=10, sticky="s")
+
     def update(self, pickle_filepath=None, config=None):
         """
         Update plot and metadata
@@ -260,9 +283,35 @@ class PlotMainFrame(customtkinter.CTkFrame):
         self.plot_control.replot(pickle_filepath, config)
         self.canvas.draw()
         self.toolbar.update()
-        self.meta_frame.update(pickle_filepath=pickle_filepath)
+        # Metadata changes only with the files, taken from the plotted DataFrames
+        if pickle_filepath is not None:
+            self.meta_frame.update(pickle_filepath=pickle_filepath, dfs=self.plot_control.dfs)
 
     
+    def color_callback(self, event=None):
+        """
+        Redraw curves colored by the metadata key (one color each if empty)
+        """
+        key = self.entry_color.get().strip()
+        self.update(config={"color_by": key if key else None})
+
+    def button_map_callback(self):
+        """
+        When pressed, open a map of the plotted files
+        """
+        files = list(self.plot_control.dfs.keys())
+        if files:
+            MapWindow(self, files=files)
+
+    def button_fit_callback(self):
+        """
+        When pressed, fit all plotted curves
+        """
+        results = self.plot_control.fit_all(self.combo_func.get())
+        if results is not None:
+            self.canvas.draw()
+            print(results.drop(columns="covariance").to_string(index=False))
+
     def button_save_callback(self):
         """
         When pressed, save png
@@ -272,6 +321,61 @@ class PlotMainFrame(customtkinter.CTkFrame):
             tk.messagebox.showinfo("Success", f"Exported to {filepath}")
 
 
+class MapWindow(customtkinter.CTkToplevel):
+    """
+    Waterfall / 2D map of the files, one row per file or per metadata value
+    """
+    def __init__(self, *args, files=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.fonts = (FONT_TYPE, 15)
+        self.title("Map")
+        self.geometry("900x700")
+        # Import map function from external file
+        self.map_control = MapControl()
+
+        # Setup form
+        self.setup_form()
+        self.update(files=files)
+
+    def setup_form(self):
+        # Resize configuration
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure((0,1,2), weight=1)
+
+        self.canvas = FigureCanvasTkAgg(self.map_control.fig, master=self)
+        self.canvas.get_tk_widget().grid(row=0, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
+
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self, pack_toolbar=False)
+        self.toolbar.grid(row=1, column=0, columnspan=3, padx=10, sticky="ew")
+
+        # Metadata key for the y axis, file index if empty
+        self.entry_key = customtkinter.CTkEntry(self, placeholder_text="y axis (metadata key)", width=200)
+        self.entry_key.grid(row=2, column=0, padx=10, pady=10)
+        self.entry_key.bind("<Return>", lambda event: self.update())
+
+        self.combo_scale = customtkinter.CTkComboBox(self, font=self.fonts, values=["dB", "linear"], command=lambda value: self.update())
+        self.combo_scale.grid(row=2, column=1, padx=10, pady=10)
+
+        self.button_save = customtkinter.CTkButton(master=self, command=self.button_save_callback, text="Save as .png", font=self.fonts)
+        self.button_save.grid(row=2, column=2, padx=10, pady=10)
+
+    def update(self, files=None):
+        """
+        Update map, files are resampled only when given
+        """
+        key = self.entry_key.get().strip()
+        config = {"y_key": key if key else None, "scale": self.combo_scale.get()}
+        self.map_control.replot(files, config)
+        self.canvas.draw()
+        self.toolbar.update()
+
+    def button_save_callback(self):
+        filepath = self.map_control.save_fig()
+        if filepath is not None:
+            tk.messagebox.showinfo("Success", f"Exported to {filepath}")
+
+
 # Change plot line setting (not used)
 class PlotConfigFrame(customtkinter.CTkFrame):
     """
@@ -353,7 +457,7 @@ class MetaFrame(customtkinter.CTkFrame):
         # self.cell = customtkinter.CTkScrollableFrame(self, width=300)
         # self.cell.grid(row=1, column=0, padx=20, sticky="ns")
     
-    def update(self, pickle_filepath=None, config=None):
+    def update(self, pickle_filepath=None, config=None, dfs=None):
         # Clear metadata
         for widget in self.winfo_children():
             widget.destroy()
@@ -364,8 +468,11 @@ class MetaFrame(customtkinter.CTkFrame):
         count = 0
         gap = 2
         for file_name in pickle_filepath:
-            df = self.plot_control.show_meta(file_name, config)
-            
+            # DataFrames already loaded for the plot are not read again
+            df = dfs.get(file_name) if dfs is not None else self.plot_control.show_meta(file_name, config)
+            if df is None:
+                continue
+
             for i in np.arange(len(list(df.attrs.keys()))):
                 if count ==0:
                     data = customtkinter.CTkLabel(self.cell, text=f'Curve {count+1}', anchor='center')
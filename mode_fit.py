@@ -0,0 +1,284 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_io import read_dataframe
+from fit_guess import (
+    FWHM_SIGMA,
+    estimate_offset,
+    gauss_shape,
+    guess_peaks,
+    lorentz_shape,
+    smooth,
+)
+from fitting import FIT_FUNCTIONS, FIT_JACOBIANS
+
+# Single peak models which can be summed, parameters offset, x0, height, dx
+MODE_FUNCTIONS = {"Lorentz": lorentz_shape, "Gauss": gauss_shape}
+# Peaks higher and more prominent than this times the noise are modes
+THRESHOLD_NOISE = 5
+# Points averaged before looking for peaks
+SMOOTH_POINTS = 5
+# Half width of the window of a mode in linewidths, overlapping windows are merged
+WINDOW_WIDTHS = 5
+# Windows fitted in worker processes from this number on, a window takes a few ms
+PARALLEL_MIN_WINDOWS = 16
+
+# Columns of the mode table, linewidth is the full width at half maximum
+MODE_COLUMNS = [
+    "frequency",
+    "frequency_err",
+    "linewidth",
+    "linewidth_err",
+    "amplitude",
+    "amplitude_err",
+    "Q",
+    "Q_err",
+    "offset",
+    "window",
+    "window_start",
+    "window_stop",
+    "converged",
+]
+
+
+def find_modes(x, y, threshold=None):
+    """
+    Peaks of a spectrum (x sorted) higher and more prominent than threshold
+    above the background, THRESHOLD_NOISE times the noise by default.
+    Returns arrays of index, height and full width at half maximum (in x),
+    and the threshold.
+    """
+    from scipy.signal import find_peaks, peak_widths
+
+    offset = np.median(y)
+    if threshold is None:
+        # Noise from the median absolute deviation, peaks are rare points
+        threshold = THRESHOLD_NOISE * 1.4826 * np.median(np.abs(y - offset))
+
+    d = smooth(y - offset, SMOOTH_POINTS)
+    index, properties = find_peaks(d, height=threshold, prominence=threshold)
+    if len(index) == 0:
+        return index, np.zeros(0), np.zeros(0), threshold
+
+    _, _, left, right = peak_widths(d, index, rel_height=0.5)
+    samples = np.arange(len(x))
+    fwhm = np.interp(right, samples, x) - np.interp(left, samples, x)
+    return index, properties["peak_heights"], fwhm, threshold
+
+
+def partition(x, index, fwhm):
+    """
+    Windows of WINDOW_WIDTHS linewidths around each mode, overlapping windows
+    merged. Returns (start, stop, modes) with slice indices of x and the modes.
+    """
+    order = np.argsort(x[index])
+    windows = []
+    for k in order:
+        start = np.searchsorted(x, x[index[k]] - WINDOW_WIDTHS * fwhm[k])
+        stop = np.searchsorted(x, x[index[k]] + WINDOW_WIDTHS * fwhm[k], side="right")
+        if windows and start < windows[-1][1]:
+            # Overlapping peaks are fitted together
+            windows[-1][1] = max(windows[-1][1], stop)
+            windows[-1][2].append(k)
+        else:
+            windows.append([start, stop, [k]])
+    return [tuple(window) for window in windows]
+
+
+def peak_sum(func_name):
+    """Sum of peaks of func_name on one offset, and its Jacobian"""
+    func = FIT_FUNCTIONS[func_name]
+    jac = FIT_JACOBIANS[func_name]
+
+    def model(x, offset, *para):
+        y = np.full(np.shape(x), offset, dtype=np.float64)
+        for k in range(0, len(para), 3):
+            y += func(x, 0.0, *para[k : k + 3])
+        return y
+
+    def model_jac(x, offset, *para):
+        columns = [np.ones((len(x), 1))]
+        for k in range(0, len(para), 3):
+            columns.append(jac(x, offset, *para[k : k + 3])[:, 1:])
+        return np.concatenate(columns, axis=1)
+
+    return model, model_jac
+
+
+def fit_window(x, y, func_name, peaks, threshold=0, maxfev=None):
+    """
+    Fit the peaks [(x0, height, fwhm), ...] of one window with a sum model.
+    Peaks fitted lower than threshold (noise on the flank of a larger peak)
+    are removed and the window is fitted again.
+    Returns (para, cov, kept), para is [offset, x0, height, dx, x0, height,
+    dx, ...] of the kept peaks, or the pre-fit with cov None if curve_fit fails.
+    """
+    kept = list(range(len(peaks)))
+    while True:
+        para, cov = fit_peaks(x, y, func_name, [peaks[k] for k in kept], maxfev)
+        low = [k for k, height in zip(kept, para[2::3]) if height < threshold]
+        if cov is None or not low or len(low) == len(kept):
+            return para, cov, kept
+        kept = [k for k in kept if k not in low]
+
+
+def fit_peaks(x, y, func_name, peaks, maxfev=None):
+    """Fit a sum model seeded with peaks [(x0, height, fwhm), ...]"""
+    from scipy.optimize import curve_fit
+
+    shape = MODE_FUNCTIONS[func_name]
+    offset, peaks = guess_peaks(
+        x, y, [peak + (shape,) for peak in peaks], estimate_offset(y)
+    )
+    p0 = [offset]
+    for x0, height, fwhm, _ in peaks:
+        p0 += [x0, height, fwhm / FWHM_SIGMA if func_name == "Gauss" else fwhm]
+
+    model, model_jac = peak_sum(func_name)
+    kwargs = {}
+    if maxfev is not None:
+        kwargs["maxfev"] = maxfev
+    try:
+        return curve_fit(model, x, y, p0=p0, jac=model_jac, **kwargs)
+    except (RuntimeError, ValueError, TypeError):
+        return np.asarray(p0), None
+
+
+def fit_window_task(args):
+    return fit_window(*args)
+
+
+def fit_modes(x, y, func_name="Lorentz", threshold=None, maxfev=None, workers=None):
+    """
+    Find all modes of a spectrum and fit them, each window of overlapping
+    modes with a sum of func_name peaks. Windows are fitted in worker
+    processes when there are many of them.
+    Returns the mode table, one row per mode sorted by frequency with
+    the fitted parameters, their standard errors and Q = frequency / FWHM.
+    """
+    import pandas as pd
+
+    if func_name not in MODE_FUNCTIONS:
+        raise ValueError(f"Modes can not be fitted with {func_name}")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+
+    index, heights, fwhm, threshold = find_modes(x, y, threshold)
+    windows = partition(x, index, fwhm)
+    tasks = [
+        (
+            x[start:stop],
+            y[start:stop],
+            func_name,
+            [(x[index[k]], heights[k], fwhm[k]) for k in modes],
+            threshold,
+            maxfev,
+        )
+        for start, stop, modes in windows
+    ]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers > 1 and len(tasks) >= PARALLEL_MIN_WINDOWS:
+        chunksize = -(-len(tasks) // (4 * workers))
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(fit_window_task, tasks, chunksize=chunksize))
+    else:
+        results = [fit_window(*task) for task in tasks]
+
+    rows = []
+    for window, ((start, stop, _), (para, cov, kept)) in enumerate(
+        zip(windows, results)
+    ):
+        errors = np.sqrt(np.abs(np.diag(cov))) if cov is not None else None
+        # Gauss is fitted with sigma, the table has the FWHM of both models
+        fwhm_factor = FWHM_SIGMA if func_name == "Gauss" else 1
+        for k in range(len(kept)):
+            i = 1 + 3 * k
+            row = dict(
+                zip(
+                    ["frequency", "amplitude", "linewidth"],
+                    [para[i], para[i + 1], abs(para[i + 2]) * fwhm_factor],
+                )
+            )
+            row["offset"] = para[0]
+            row["window"] = window
+            row["window_start"] = x[start]
+            row["window_stop"] = x[stop - 1]
+            row["converged"] = cov is not None
+            row["Q"] = row["frequency"] / row["linewidth"]
+            if errors is not None:
+                row["frequency_err"] = errors[i]
+                row["amplitude_err"] = errors[i + 1]
+                row["linewidth_err"] = errors[i + 2] * fwhm_factor
+                # Q from the covariance of frequency and linewidth
+                relative = (
+                    cov[i, i] / para[i] ** 2
+                    + cov[i + 2, i + 2] / para[i + 2] ** 2
+                    - 2 * cov[i, i + 2] / (para[i] * para[i + 2])
+                )
+                row["Q_err"] = row["Q"] * np.sqrt(abs(relative))
+            rows.append(row)
+
+    table = pd.DataFrame(rows, columns=MODE_COLUMNS)
+    return table.sort_values("frequency", ignore_index=True)
+
+
+def mode_curves(table, func_name="Lorentz", n_points=200):
+    """x and y of the fitted sum model of each window, separated by NaN"""
+    func = FIT_FUNCTIONS[func_name]
+    # Width parameter of the function from the FWHM in the table
+    fwhm_factor = FWHM_SIGMA if func_name == "Gauss" else 1
+    xs, ys = [], []
+    for _, rows in table.groupby("window"):
+        x = np.linspace(
+            rows["window_start"].iloc[0], rows["window_stop"].iloc[0], n_points
+        )
+        y = np.full(n_points, rows["offset"].iloc[0])
+        for row in rows.itertuples():
+            y += func(
+                x, 0.0, row.frequency, row.amplitude, row.linewidth / fwhm_factor
+            )
+        xs += [x, [np.nan]]
+        ys += [y, [np.nan]]
+    if not xs:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fit all modes of the spectra and write a mode table per file"
+    )
+    parser.add_argument("files", nargs="+", help=".h5/.pickle/.npcol files")
+    parser.add_argument("--model", choices=list(MODE_FUNCTIONS), default="Lorentz")
+    parser.add_argument("--lower", type=float, default=0, help="Lower limit (0-1)")
+    parser.add_argument("--upper", type=float, default=1, help="Upper limit (0-1)")
+    parser.add_argument(
+        "--threshold", type=float, default=None, help="Height above background"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for file in args.files:
+        df = read_dataframe(file)
+        columns = list(df.keys())
+        length = len(df[columns[0]])
+        low, up = int(args.lower * length), int(args.upper * length)
+        table = fit_modes(
+            df[columns[0]][low:up],
+            df[columns[1]][low:up],
+            args.model,
+            threshold=args.threshold,
+            workers=args.workers,
+        )
+        export_path = f"{os.path.splitext(file)[0]}_modes.csv"
+        table.to_csv(export_path, index=False)
+        print(f"{file}: {len(table)} modes -> {export_path}")
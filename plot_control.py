@@ -1,44 +1,64 @@
 import os
 
-import customtkinter
-import matplotlib.pyplot as plt
+import matplotlib.style
 import numpy as np
-import pandas as pd
-from scipy.constants import c, hbar
-from scipy.optimize import curve_fit
+from matplotlib.figure import Figure
 
-from FitFunctions import Functions
+from data_cache import load_dataframe, shared_cache
+from data_io import read_rows, write_metadata
+from fit_cache import shared_fit_cache
+from fitting import FIT_FUNCTIONS, make_fit_dict
+from gorodetsky import DEFAULT_POWER_LOSS, DEFAULT_TEMPERATURE, estimate_g0
+from mode_fit import fit_modes, mode_curves
+from plot_lod import ArraySource, EnvelopeLine, open_pyramid
+
+# Points of the fitting curve, up to the points of the data (narrow tones)
+FIT_CURVE_POINTS = (1000, 20000)
 
 
 class PlotControl:
-    def __init__(self) -> None:
-        plt.style.use("dark_background")
-        self.fig = plt.figure()
+    def __init__(self, interactive=True) -> None:
+        # Figure without pyplot, it is only shown in the canvas of the GUI
+        matplotlib.style.use("dark_background")
+        self.fig = Figure()
         self.ax = self.fig.add_subplot(1, 1, 1)
         # Config setting for plot
-        self.config = {"linewidth": 1, "linetype": "line", "upper": 1, "lower": 0}
+        self.config = {
+            "linewidth": 1,
+            "linetype": "line",
+            "upper": 1,
+            "lower": 0,
+            "decimate": True,
+        }
         # Config setting for fit
         self.fit_config = {
             "FitFunc": "None",
             "WidthRatio": None,
             "WidthRatio_sub": None,
+            "MaxFev": None,
         }
         self.filepath = None
         self.df = None
+        # In interactive mode fit results are kept in memory until committed
+        self.interactive = interactive
+        self.pending_fit = {}
+        # Covariance of the fits of the current file by fit function
+        self.fit_cov = {}
+        # Artists kept between updates
+        self.data_line = None
+        self.fit_line = None
+        self.style = None
+        self.pyramid = None
+        self.fit_range = (None, None)
+        # ((filepath, low, up), (x, y)) of the rows read for fitting only
+        self.range_data = None
 
     def get_dataframe(self, filename=None):
         # Update data when file name is set
         if filename is not None:
-            # Read file data
+            # Read file data (shared cache)
             self.filepath = filename
-            if self.filepath.endswith(".pickle"):
-                df = pd.read_pickle(filename)
-
-            elif self.filepath.endswith(".h5"):
-                # Read DataFrame and retrieve attributes
-                with pd.HDFStore(filename) as store:
-                    df = store["df"]  # Load the DataFrame
-                    df.attrs = store.get_storer("df").attrs.metadata
+            df = load_dataframe(filename)
 
             return df
         else:
@@ -50,97 +70,102 @@ class PlotControl:
     def update_dataframe(self, filename=None, fit_dict=None):
         """This is to add fitted parametes etc. to the metadata of the file"""
         # Update data when file name is set
-        if filename is None:
+        if filename is None or fit_dict is None:
             return
-        else:
-            # Read file data
-            self.filepath = filename
-            if self.filepath.endswith(".pickle"):
-                df = pd.read_pickle(self.filepath)
 
-            elif self.filepath.endswith(".h5"):
-                # Read DataFrame and retrieve attributes
-                with pd.HDFStore(self.filepath) as store:
-                    df = store["df"]  # Load the DataFrame
-                    df.attrs = store.get_storer("df").attrs.metadata
+        df = shared_cache.get(filename)
 
-        if fit_dict is not None:
-            df.attrs.update(fit_dict)
-
-        if self.filepath.endswith(".pickle"):
-            df.to_pickle(self.filepath)
+        # Only the metadata is written, the data itself is not rewritten
+        write_metadata(filename, fit_dict)
 
-        elif self.filepath.endswith(".h5"):
-            # Store DataFrame to HDF5 with a key
-            with pd.HDFStore(self.filepath) as store:
-                store.put("df", df)
-                # Add an attribute
-                store.get_storer("df").attrs.metadata = df.attrs
+        # Keep the cached data valid instead of reading it again
+        if df is not None:
+            df = df.copy(deep=False)
+            df.attrs.update(fit_dict)
+            shared_cache.put(filename, df)
 
-    def replot(self, filename=None, config=None, fit_config=None):
+    def replot(self, filename=None, config=None, fit_config=None, fit=True):
         """
         Update plot
+        With fit=False the fit is left to the caller, e.g. a background FitWorker
         """
+        # Update when configuration is set
+        if config is not None:
+            self.config.update(config)
+
+        if fit_config is not None:
+            self.fit_config.update(fit_config)
+
         # Update data when file name is set
         if filename is not None:
-            # Read file data
+            # Write back fit results of the previous file
+            if filename != self.filepath:
+                self.commit_fit()
+                self.fit_cov = {}
             self.filepath = filename
-            if self.filepath.endswith(".pickle"):
-                self.df = pd.read_pickle(filename)
+            self.df = None
+            self.range_data = None
+            # Traces with a pyramid are drawn without reading the full data
+            self.pyramid = open_pyramid(filename)
 
-            elif self.filepath.endswith(".h5"):
-                # Read DataFrame and retrieve attributes
-                with pd.HDFStore(filename) as store:
-                    self.df = store["df"]  # Load the DataFrame
-                    self.df.attrs = store.get_storer("df").attrs.metadata
+        use_pyramid = self.pyramid is not None and self.config["decimate"]
+        if self.df is None and not use_pyramid and self.filepath is not None:
+            self.df = self.load_data()
 
-        if self.df is None:
+        if self.df is None and not use_pyramid:
             print("df is None")
             return
 
-        # Update when configuration is set
-        if config is not None:
-            self.config.update(config)
-
-        if fit_config is not None:
-            self.fit_config.update(fit_config)
-
-        # Clear plot before update
-        self.ax.clear()
+        if self.df is not None:
+            columns = list(self.df.keys())
+            length = len(self.df[columns[0]])
+        else:
+            columns = self.pyramid.columns
+            length = self.pyramid.length
 
         # Set upper and lower limit
-        up = int(self.config["upper"] * len(self.df[list(self.df.keys())[0]]))
-        low = int(self.config["lower"] * len(self.df[list(self.df.keys())[0]]))
+        up = int(self.config["upper"] * length)
+        low = int(self.config["lower"] * length)
+        self.fit_range = (low, up)
 
         # plot
         # Different types of plot (not usually used)
         if self.config["linetype"] == "line + marker":
-            self.ax.plot(
-                self.df[list(self.df.keys())[0]][low:up],
-                self.df[list(self.df.keys())[1]][low:up],
-                "o-",
-                linewidth=self.config["linewidth"],
-            )
-
+            fmt = "o-"
         elif self.config["linetype"] == "dashed":
-            self.ax.plot(
-                self.df[list(self.df.keys())[0]][low:up],
-                self.df[list(self.df.keys())[1]][low:up],
-                "--",
-                linewidth=self.config["linewidth"],
-            )
+            fmt = "--"
+        else:
+            fmt = "-"
+
+        if self.df is None:
+            # Only the levels of the pyramid needed for the view are read
+            source = open_pyramid(self.filepath, low, up)
         else:
-            self.ax.plot(
-                self.df[list(self.df.keys())[0]][low:up],
-                self.df[list(self.df.keys())[1]][low:up],
-                linewidth=self.config["linewidth"],
+            # Draw min/max envelope at screen resolution, fitting uses all points
+            source = ArraySource(
+                self.df[columns[0]][low:up],
+                self.df[columns[1]][low:up],
+                decimate=self.config["decimate"],
             )
 
-        self.ax.set_xlabel(list(self.df.keys())[0])
-        self.ax.set_ylabel(list(self.df.keys())[1])
-        self.fig.tight_layout()
+        style = (fmt, self.config["linewidth"])
+        if filename is None and self.data_line is not None and style == self.style:
+            # Keep the artists and only replace their data
+            self.fit_line.set_data([], [])
+            self.data_line.set_source(source)
+        else:
+            # Clear plot and create the artists for a new file or line style
+            self.ax.clear()
+            self.style = style
+            self.data_line = EnvelopeLine(
+                self.ax, source, fmt, linewidth=self.config["linewidth"]
+            )
+            (self.fit_line,) = self.ax.plot([], [])
+            self.ax.set_xlabel(columns[0])
+            self.ax.set_ylabel(columns[1])
+            self.fig.tight_layout()
 
-        if self.fit_config["FitFunc"] is not None:
+        if self.fit_config["FitFunc"] is not None and fit:
             if self.fit_config["FitFunc"] != "None":
                 try:
                     para = self.create_fitting(
@@ -150,12 +175,8 @@ class PlotControl:
                         up=up,
                         low=low,
                     )
-                    fit_dict = {}
-                    fit_dict[self.fit_config["FitFunc"] + "_offset"] = para[0]
-                    fit_dict[self.fit_config["FitFunc"] + "_eigenfrequency"] = para[1]
-                    fit_dict[self.fit_config["FitFunc"] + "_amplitude"] = para[2]
-                    fit_dict[self.fit_config["FitFunc"] + "_linewidth"] = para[3]
-                    self.update_dataframe(filename=self.filepath, fit_dict=fit_dict)
+                    fit_dict = make_fit_dict(self.fit_config["FitFunc"], para)
+                    self.record_fit(fit_dict)
                     return fit_dict
                 except:
                     return
@@ -164,6 +185,91 @@ class PlotControl:
                 # print('FitFunc is None')
                 return
 
+    def fit_data(self, low=None, up=None):
+        """x and y in the plot range used for fitting (full resolution)"""
+        if low is None and up is None:
+            low, up = self.fit_range
+        if self.df is None and self.filepath.endswith(".h5"):
+            # e.g. drawn from a pyramid, only the rows in the range are read
+            return self.read_range(low, up)
+        if self.df is None:
+            self.df = self.load_data()
+
+        columns = list(self.df.keys())
+        return self.df[columns[0]][low:up], self.df[columns[1]][low:up]
+
+    def read_range(self, low, up):
+        """x and y of the rows [low:up] of the current .h5 file"""
+        key = (self.filepath, low, up)
+        if self.range_data is not None and self.range_data[0] == key:
+            return self.range_data[1]
+
+        # Slice the full data if it has been loaded already (e.g. prefetched)
+        df = shared_cache.get(self.filepath)
+        if df is not None:
+            df = df.iloc[low:up]
+        else:
+            df = read_rows(self.filepath, low, up)
+        columns = list(df.keys())
+        self.range_data = (key, (df[columns[0]], df[columns[1]]))
+        return self.range_data[1]
+
+    def apply_fit(self, func_name, para, x, cov=None):
+        """Show and record result of a fit done outside of replot"""
+        self.show_fit(FIT_FUNCTIONS[func_name], para, x)
+        self.keep_cov(func_name, cov)
+        fit_dict = make_fit_dict(func_name, para)
+        self.record_fit(fit_dict)
+        return fit_dict
+
+    def show_fit(self, func, para, x):
+        """Draw fitting curve by updating the data of the fit line"""
+        n_points = min(max(len(x), FIT_CURVE_POINTS[0]), FIT_CURVE_POINTS[1])
+        new_x = np.linspace(np.min(x), np.max(x), n_points)
+        self.fit_line.set_data(new_x, func(new_x, *para))
+
+    def keep_cov(self, func_name, cov):
+        """Keep the covariance of a fit of the current file, e.g. for g0"""
+        # The joint fit replaces separate Lorentz and Gauss fits and vice versa
+        if func_name == "Gorodetsky":
+            self.fit_cov.pop("Lorentz", None)
+            self.fit_cov.pop("Gauss", None)
+        elif func_name in ("Lorentz", "Gauss"):
+            self.fit_cov.pop("Gorodetsky", None)
+        self.fit_cov[func_name] = cov
+
+    def load_data(self):
+        """Load full data of the current file (shared cache)"""
+        df = load_dataframe(self.filepath)
+        if df is None:
+            return
+
+        # Shallow copy so that uncommitted fit results stay out of the cache
+        df = df.copy(deep=False)
+        df.attrs.update(self.pending_fit.get(self.filepath, {}))
+        return df
+
+    def record_fit(self, fit_dict):
+        """Keep fit results in memory, or write them directly if not interactive"""
+        if self.df is not None:
+            self.df.attrs.update(fit_dict)
+        if self.interactive:
+            self.pending_fit.setdefault(self.filepath, {}).update(fit_dict)
+        else:
+            self.update_dataframe(filename=self.filepath, fit_dict=fit_dict)
+
+    def commit_fit(self, filename=None, commit_all=False):
+        """Write fit results kept in memory to the file(s)"""
+        if commit_all:
+            filenames = list(self.pending_fit.keys())
+        else:
+            filenames = [filename if filename is not None else self.filepath]
+
+        for file in filenames:
+            fit_dict = self.pending_fit.pop(file, None)
+            if fit_dict:
+                self.update_dataframe(filename=file, fit_dict=fit_dict)
+
     def save_fig(self, export_path=None):
         """
         Save figure
@@ -179,141 +285,56 @@ class PlotControl:
         self.fig.savefig(export_path)
         return export_path
 
-    def create_fitting(
-        self, file_name, fit_config=None, config=None, up=None, low=None
-    ):
-        self.df = self.get_dataframe(file_name)
-
-        x = list(self.df[list(self.df.keys())[0]][low:up])
-        y = list(self.df[list(self.df.keys())[1]][low:up])
+    def fit_modes(self, func_name="Lorentz", threshold=None):
+        """Fit all modes in the plot range and draw them, returns the mode table"""
+        x, y = self.fit_data()
+        table = fit_modes(x, y, func_name, threshold=threshold)
+        self.fit_line.set_data(*mode_curves(table, func_name))
+        return table
 
-        if fit_config["WidthRatio"] is not None:
-            width_ratio = fit_config["WidthRatio"]
-        else:
-            width_ratio = 0.5
-
-        # Mechanical Lorentzian
-        if fit_config["FitFunc"] == "Lorentz":
-            offset = 0.5 * (np.mean(y[:10]) + np.mean(y[-10:]))
-            height = np.nanmax(y) - offset
-            x0 = x[np.nanargmax(y)]
-            dx = (np.max(x) - np.min(x)) * width_ratio
-            try:
-                para, cov = curve_fit(
-                    Functions.Lorentz, x, y, p0=[offset, x0, height, dx]
-                )
-            except:
-                return
+    def save_modes(self, table, export_path=None):
+        """Save the mode table next to the data file"""
+        if export_path is None and self.filepath is not None:
+            file, ext = os.path.splitext(self.filepath)
+            export_path = f"{file}_modes.csv"
 
-            # Plot fitting curve if successful
-            new_x = list(
-                np.arange(np.min(x), np.max(x), (np.max(x) - np.min(x)) / 1000)
-            )
-            self.ax.plot(
-                new_x, Functions.Lorentz(new_x, para[0], para[1], para[2], para[3])
-            )
-            self.fig.tight_layout()
-            print("Lorentz fit is done")
-            return para
-
-        # Calibration tone (Gaussian)
-        elif fit_config["FitFunc"] == "Gauss":
-            offset = 0.5 * (np.mean(y[:10]) + np.mean(y[-10:]))
-            height = np.nanmax(y) - offset
-            x0 = x[np.nanargmax(y)]
-            dx = (np.max(x) - np.min(x)) * width_ratio
-            para, cov = curve_fit(Functions.Gauss, x, y, p0=[offset, x0, height, dx])
-            # Plot fitting curve if successful
-            if para is not None:
-                new_x = list(
-                    np.arange(np.min(x), np.max(x), (np.max(x) - np.min(x)) / 1000)
-                )
-                self.ax.plot(
-                    new_x, Functions.Gauss(new_x, para[0], para[1], para[2], para[3])
-                )
-                self.fig.tight_layout()
-                # print("Gauss fit is done")
-                return para
-
-        # Optical resonance
-        elif fit_config["FitFunc"] == "Fano":
-            offset = 0.5 * (np.mean(y[:5]) + np.mean(y[-5:]))
-            height = np.nanmin(y) - offset
-            x0 = x[np.nanargmin(y)]
-            dx = (np.max(x) - np.min(x)) * width_ratio
-            q = 0.1
-            try:
-                para, cov = curve_fit(
-                    Functions.Fano, x, y, p0=[offset, x0, height, dx, q]
-                )
-            except:
-                return
+        if export_path is None:
+            return
 
-            # Plot fitting curve if successful
-            if para is not None:
-                new_x = list(
-                    np.arange(np.min(x), np.max(x), (np.max(x) - np.min(x)) / 1000)
-                )
-                self.ax.plot(
-                    new_x,
-                    Functions.Fano(new_x, para[0], para[1], para[2], para[3], para[4]),
-                )
-                self.fig.tight_layout()
-                # print("Fano fit is done")
-                return para
-
-        # # Gorodetsky with smaller calibration freq
-        # elif fit_config["FitFunc"] == "Gorodetsky_Left":
-        #     offset = 0.5 * (np.mean(y[:5]) + np.mean(y[-5:]))
-
-        #     # Index at half of data point
-        #     half = int(len(x) / 2)
-
-        #     # Mechanical Lorentzian parameters
-        #     Lheight = np.nanmin(y[half:]) - offset
-        #     Lx0 = x[np.nanargmin(y[half:])]
-        #     Ldx = (np.max(x[half:]) - np.min(x[half:])) * width_ratio
-
-        #     # Gaussian tone parameters
-        #     Gheight = np.nanmin(y[:half]) - offset
-        #     Gx0 = x[np.nanargmin(y[:half])]
-        #     Gdx = (np.max(x[:half]) - np.min(x[:half])) * width_ratio_sub
-
-        #     para, cov = curve_fit(
-        #         Functions.Gorodetsky,
-        #         x,
-        #         y,
-        #         p0=[offset, Lx0, Lheight, Ldx, Gx0, Gheight, Gdx],
-        #     )
-
-        #     if para is not None:
-        #         new_x = list(
-        #             np.arange(np.min(x), np.max(x), (np.max(x) - np.min(x)) / 1000)
-        #         )
-        #         self.ax.plot(
-        #             new_x,
-        #             Functions.Fano(
-        #                 new_x,
-        #                 para[0],
-        #                 para[1],
-        #                 para[2],
-        #                 para[3],
-        #                 para[4],
-        #                 para[5],
-        #                 para[6],
-        #             ),
-        #         )
-        #         self.fig.tight_layout()
-        #         # print("Gorodetsky fit is done")
-        #         return para
-
-        #     return
-
-        # elif fit_config["FitFunc"] == "None":
-        #     return
+        table.to_csv(export_path, index=False)
+        return export_path
 
-        else:
+    def create_fitting(
+        self, file_name, fit_config=None, config=None, up=None, low=None
+    ):
+        # Fit the data in memory, otherwise read only the rows to fit (.h5)
+        if file_name != self.filepath:
+            self.commit_fit()
+            self.fit_cov = {}
+            self.filepath = file_name
+            self.df = None
+            self.range_data = None
+
+        x, y = self.fit_data(low, up)
+
+        # A range fitted before is not fitted again
+        result = shared_fit_cache.fit(
+            x,
+            y,
+            fit_config["FitFunc"],
+            width_ratio=fit_config["WidthRatio"],
+            maxfev=fit_config.get("MaxFev"),
+            bounds=self.fit_range if low is None and up is None else (low, up),
+        )
+        if result is None:
             return
+        para, cov = result
+        self.keep_cov(fit_config["FitFunc"], cov)
+
+        # Plot fitting curve if successful
+        self.show_fit(FIT_FUNCTIONS[fit_config["FitFunc"]], para, x)
+        print(f"{fit_config['FitFunc']} fit is done")
+        return para
 
     # Esticate g0 based on fitted parameters
     def estimate_g0(
@@ -326,38 +347,22 @@ class PlotControl:
         ENBW,
         Vpi,
         mod_power_dBm,
-        power_loss=1.34**-1,
+        power_loss=DEFAULT_POWER_LOSS,
+        temperature=DEFAULT_TEMPERATURE,
     ):
-        # Physical constants
-        self.kb = 1.380649e-23
-        self.planck = 6.62607015e-34
-        self.temperature = 273.15 + 21
-        # Voltages to get modulation depth
-        # V_pi = 6 # Value from the iXblue spec sheet at 10GHz. 9V for 16GHz and 4V for 50kHz
-        # V = (965e-5)*2 # For -40dBm and ENBW = 30kHz,
-        V_pi = Vpi  # 6.5 # Thorlabs EOM
-        valon_power = mod_power_dBm  # dBm
-        valon_power = 10 ** (valon_power / 10) * 1e-3
-        valon_V = np.sqrt(power_loss * valon_power * 50)
-        V = valon_V * np.sqrt(2)
-        beta = V / V_pi * np.pi
-
-        nth = 1.0 / (np.exp(self.planck * mech_freq / (self.kb * self.temperature)) - 1)
-        # '''Below calculates g0. gamma should be expressed in angular frequency so it's multiplied by 2pi while ENBW is in direct frequency.'''
-        g0 = np.sqrt(
-            0.5
-            / nth
-            * (beta**2)
-            * (abs(mod_freq) ** 2)
-            / 2
-            * abs(mech_height)
-            * abs(gamma)
-            * 2
-            * np.pi
-            / 4
-            / (abs(mod_height) * ENBW)
+        # Arrays of a whole sweep are accepted as well, see gorodetsky.py
+        return estimate_g0(
+            mech_freq,
+            mech_height,
+            gamma,
+            mod_freq,
+            mod_height,
+            ENBW,
+            Vpi,
+            mod_power_dBm,
+            power_loss=power_loss,
+            temperature=temperature,
         )
-        return g0
 
 
 # if __name__ == "__main__":
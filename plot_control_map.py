@@ -0,0 +1,277 @@
+import os
+
+import matplotlib.style
+import numpy as np
+from matplotlib.figure import Figure
+
+from data_cache import load_dataframes, shared_cache
+from data_io import open_store
+
+# Memory used for temporary arrays while resampling (bytes)
+CHUNK_BYTES = 64 * 1024**2
+# Files loaded at once, the map itself only keeps the resampled rows
+FILES_PER_CHUNK = 32
+
+
+def h5_range(filename):
+    """
+    Range of x, metadata and columns of .h5 file from its first and last rows,
+    x of a trace is monotonic. Only these rows are read.
+    """
+    with open_store(filename) as store:
+        storer = store.get_storer("df")
+        length = storer.nrows if storer.is_table else storer.shape[0]
+        first = store.select("df", start=0, stop=1)
+        last = store.select("df", start=length - 1, stop=length)
+        metadata = dict(storer.attrs.metadata)
+    columns = list(first.keys())
+    ends = [first[columns[0]].iloc[0], last[columns[0]].iloc[0]]
+    return min(ends), max(ends), metadata, columns
+
+
+def resample_rows(x, Y, grid):
+    """
+    Resample the rows of Y (traces on the common sorted x) onto grid.
+    Traces finer than the grid are averaged over the grid bins so that narrow
+    peaks are not skipped, coarser traces are linearly interpolated.
+    Points of the grid outside of x are NaN.
+    """
+    out = np.full((len(Y), len(grid)), np.nan, dtype=np.float32)
+
+    if len(x) > 2 * len(grid):
+        # Bin edges halfway between the grid points
+        edges = np.concatenate([[-np.inf], (grid[1:] + grid[:-1]) / 2, [np.inf]])
+        start = np.searchsorted(x, edges[:-1], side="left")
+        stop = np.searchsorted(x, edges[1:], side="left")
+        # reduceat sums up to the next start, the non-empty bins are contiguous
+        filled = stop > start
+        sums = np.add.reduceat(Y, start[filled], axis=1)
+        out[:, filled] = sums / (stop[filled] - start[filled])
+    else:
+        inside = (grid >= x[0]) & (grid <= x[-1])
+        i = np.clip(np.searchsorted(x, grid[inside]) - 1, 0, len(x) - 2)
+        w = (grid[inside] - x[i]) / (x[i + 1] - x[i])
+        out[:, inside] = Y[:, i] + w * (Y[:, i + 1] - Y[:, i])
+    return out
+
+
+class MapControl:
+    """
+    Waterfall / 2D map of a sweep: x of the traces, one row per file
+    (or the value of a metadata key) and the color for y, e.g. PSD.
+    All traces are resampled onto a common grid stored as float32.
+    """
+
+    def __init__(self):
+        matplotlib.style.use("dark_background")
+        self.fig = Figure()
+        self.ax = self.fig.add_subplot(1, 1, 1)
+        # Config setting
+        # y_key: metadata key for the y axis, file index if None
+        # scale: "dB" shows 10*log10 of the values
+        self.config = {
+            "n_points": 2000,
+            "y_key": None,
+            "scale": "dB",
+            "cmap": "viridis",
+        }
+        self.filepath = None
+        self.files = []
+        # Resampled traces (files x n_points) and the common grid
+        self.grid = None
+        self.Z = None
+        self.metadata = []
+        self.columns = None
+        self.colorbar = None
+
+    def replot(self, filename=None, config=None):
+        """
+        Update map
+        Files are resampled only when the list of files or n_points changes,
+        other settings redraw the map kept in memory.
+        """
+        n_points = self.config["n_points"]
+        if config is not None:
+            self.config.update(config)
+
+        if filename is not None:
+            self.files = list(filename)
+            self.filepath = self.files[-1] if self.files else None
+        if filename is not None or n_points != self.config["n_points"]:
+            self.load()
+
+        if self.Z is None:
+            return
+        self.draw()
+
+    def load(self):
+        """Resample all files onto the common grid, a chunk of files at a time"""
+        self.Z = None
+        if not self.files:
+            return
+
+        # Range of x covering all traces. Of .h5 files not in the cache only the
+        # first and last rows are read, so that each file is read once below.
+        # .npcol is mapped and .pickle can only be read whole.
+        x_min, x_max = np.inf, -np.inf
+        metadata = []
+        for start in range(0, len(self.files), FILES_PER_CHUNK):
+            files = self.files[start : start + FILES_PER_CHUNK]
+            h5_files = [
+                f for f in files if f.endswith(".h5") and shared_cache.get(f) is None
+            ]
+            dfs = load_dataframes([f for f in files if f not in h5_files])
+            for file in files:
+                df = dfs.get(file)
+                if df is not None:
+                    x = np.asarray(df[list(df.keys())[0]], dtype=np.float64)
+                    low, high = np.nanmin(x), np.nanmax(x)
+                    attrs, columns = dict(df.attrs), list(df.keys())
+                else:
+                    try:
+                        low, high, attrs, columns = h5_range(file)
+                    except Exception:
+                        # Unreadable file (also not .h5 here), its row stays empty
+                        metadata.append({})
+                        continue
+                x_min = min(x_min, low)
+                x_max = max(x_max, high)
+                metadata.append(attrs)
+                self.columns = columns[:2]
+        if not np.isfinite(x_min):
+            return
+
+        self.grid = np.linspace(x_min, x_max, self.config["n_points"])
+        self.Z = np.full((len(self.files), len(self.grid)), np.nan, dtype=np.float32)
+        self.metadata = metadata
+
+        # Last chunks first, their files were loaded last and may still be cached
+        for start in reversed(range(0, len(self.files), FILES_PER_CHUNK)):
+            files = self.files[start : start + FILES_PER_CHUNK]
+            dfs = load_dataframes(files)
+            self.resample_chunk(start, [dfs[file] for file in files])
+
+    def resample_chunk(self, start, dfs):
+        """Resample traces, traces on the same x are done together"""
+        row = start
+        while row < start + len(dfs):
+            df = dfs[row - start]
+            if df is None:
+                row += 1
+                continue
+            x = np.asarray(df[list(df.keys())[0]], dtype=np.float64)
+            order = np.argsort(x, kind="stable")
+            x = x[order]
+
+            # Following traces with the same x
+            rows = [row]
+            while row + len(rows) < start + len(dfs):
+                other = dfs[row + len(rows) - start]
+                if other is None:
+                    break
+                other_x = np.asarray(other[list(other.keys())[0]])
+                # Checked first, order only indexes traces of the same length
+                if len(other_x) != len(x) or not np.array_equal(other_x[order], x):
+                    break
+                rows.append(row + len(rows))
+
+            # Limit the size of the stacked traces
+            step = max(CHUNK_BYTES // (8 * len(x)), 1)
+            for i in range(0, len(rows), step):
+                Y = np.stack(
+                    [
+                        np.asarray(
+                            dfs[r - start][list(dfs[r - start].keys())[1]],
+                            dtype=np.float64,
+                        )[order]
+                        for r in rows[i : i + step]
+                    ]
+                )
+                self.Z[rows[i] : rows[i] + len(Y)] = resample_rows(x, Y, self.grid)
+            row += len(rows)
+
+    def draw(self):
+        if self.colorbar is not None:
+            self.colorbar.remove()
+            self.colorbar = None
+        self.ax.clear()
+
+        Z = self.Z
+        label = self.columns[1] if self.columns else ""
+        if self.config["scale"] == "dB":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                Z = 10 * np.log10(Z)
+            Z[~np.isfinite(Z)] = np.nan
+            label = f"{label} [dB]"
+
+        key = self.config["y_key"]
+        values = None
+        if key:
+            values = np.array(
+                [to_float(attrs.get(key)) for attrs in self.metadata], dtype=np.float64
+            )
+
+        if values is not None and np.all(np.isfinite(values)) and len(values) > 1:
+            # Rows at the metadata value
+            order = np.argsort(values, kind="stable")
+            values = values[order]
+            if np.all(np.diff(values) > 0):
+                mesh = self.ax.pcolormesh(
+                    edges(self.grid), edges(values), Z[order], cmap=self.config["cmap"]
+                )
+                self.ax.set_ylabel(key)
+            else:
+                # Repeated values, rows in the order of the values
+                mesh = self.show_image(Z[order])
+                self.ax.set_ylabel(f"File index (sorted by {key})")
+        else:
+            mesh = self.show_image(Z)
+            self.ax.set_ylabel("File index")
+
+        self.colorbar = self.fig.colorbar(mesh, ax=self.ax, label=label)
+        if self.columns:
+            self.ax.set_xlabel(self.columns[0])
+        self.fig.tight_layout()
+
+    def show_image(self, Z):
+        return self.ax.imshow(
+            Z,
+            aspect="auto",
+            origin="lower",
+            interpolation="nearest",
+            cmap=self.config["cmap"],
+            extent=(self.grid[0], self.grid[-1], -0.5, len(Z) - 0.5),
+        )
+
+    def save_fig(self, export_path=None):
+        """
+        Save figure
+        """
+        # File name setting
+        if export_path is None and self.filepath is not None:
+            file, ext = os.path.splitext(self.filepath)
+            export_path = f"{file}_map.png"
+
+        if export_path is None:
+            return
+
+        self.fig.savefig(export_path)
+        return export_path
+
+
+def edges(centers):
+    """Cell edges halfway between the centers, for pcolormesh"""
+    return np.concatenate(
+        [
+            [centers[0] - (centers[1] - centers[0]) / 2],
+            (centers[1:] + centers[:-1]) / 2,
+            [centers[-1] + (centers[-1] - centers[-2]) / 2],
+        ]
+    )
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -1,86 +1,239 @@
 import os
 
 import customtkinter
-import matplotlib.pyplot as plt
+import matplotlib.style
 import numpy as np
 import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from data_cache import load_dataframe, load_dataframes
+from fitting import FIT_FUNCTIONS, FIT_PARAMETERS, fit_curve, fit_stacked
+from plot_lod import ArraySource, EnvelopeCollection
+
+# Curves are listed in a legend up to this number, a colormap has a colorbar
+LEGEND_MAX_TRACES = 10
 
 
 class PlotControl:
     def __init__(self):
-        plt.style.use("dark_background")
-        self.fig = plt.figure()
+        matplotlib.style.use("dark_background")
+        self.fig = Figure()
         self.ax = self.fig.add_subplot(1, 1, 1)
         # Config setting
-        self.config = {"linewidth": 1, "linetype": "line"}
+        # overlay: draw all curves as one LineCollection of envelopes
+        # color_by: metadata key whose value sets the color through cmap
+        self.config = {
+            "linewidth": 1,
+            "linetype": "line",
+            "overlay": True,
+            "color_by": None,
+            "cmap": "viridis",
+        }
         self.filepath = None
         self.df = None
+        # Plotted DataFrames by file name
+        self.dfs = {}
+        # Artists kept between updates
+        self.overlay = None
+        self.colorbar = None
+        self.fit_lines = {}
+        self.style = None
 
     def replot(self, filename=None, config=None):
         """
         Update plot
+        Files are read only when the list of files is given, changing the
+        configuration redraws the DataFrames kept in memory.
+        In overlay mode added and removed files do not redraw the other curves.
         """
-        # Clear plot before update
-        self.ax.clear()
-
-        count = 0
-        for file in filename:
-            # Update data when file name is set
-            if file is not None:
-                # Read file data
-                # self.filepath = file
-                # self.df = pd.read_pickle(file)
+        # Update when configuration is set
+        if config is not None:
+            self.config.update(config)
 
-                self.filepath = file
-                if self.filepath.endswith(".pickle"):
-                    self.df = pd.read_pickle(self.filepath)
+        style = tuple(
+            self.config[key]
+            for key in ("linewidth", "linetype", "overlay", "color_by", "cmap")
+        )
+        incremental = self.overlay is not None and style == self.style
 
-                elif self.filepath.endswith(".h5"):
-                    # Read DataFrame and retrieve attributes
-                    with pd.HDFStore(self.filepath) as store:
-                        self.df = store["df"]  # Load the DataFrame
-                        self.df.attrs = store.get_storer("df").attrs.metadata
+        # Update data when file names are set (read in parallel, shared cache)
+        if filename is not None:
+            added = [file for file in filename if file not in self.dfs]
+            removed = [file for file in self.dfs if file not in filename]
+            loaded = load_dataframes(added)
+            self.dfs = {
+                file: self.dfs[file] if file in self.dfs else loaded[file]
+                for file in filename
+            }
+            self.filepath = filename[-1] if filename else None
 
-            if self.df is None:
+            if incremental:
+                for file in removed:
+                    self.remove_trace(file)
+                for file in added:
+                    self.add_trace(file, self.dfs[file])
+                self.overlay.refresh(autoscale=True)
+                self.update_legend()
+                self.set_labels()
                 return
 
-            # Update when configuration is set
-            if config is not None:
-                self.config.update(config)
+        # Clear plot before update
+        self.clear()
+        self.style = style
+
+        # Different types of plot (not usually used)
+        if self.config["linetype"] == "line + marker":
+            fmt = "o-"
+        elif self.config["linetype"] == "dashed":
+            fmt = "--"
+        else:
+            fmt = "-"
 
-            # plot
-            # Different types of plot (not usually used)
-            if self.config["linetype"] == "line + marker":
+        if self.config["overlay"] and fmt != "o-":
+            self.overlay = EnvelopeCollection(
+                self.ax,
+                cmap=self.config["cmap"] if self.config["color_by"] else None,
+                linestyle=fmt,
+                linewidth=self.config["linewidth"],
+            )
+            for file, df in self.dfs.items():
+                self.add_trace(file, df)
+            self.overlay.refresh(autoscale=True)
+            self.update_legend()
+        else:
+            count = 0
+            for file, df in self.dfs.items():
+                if df is None:
+                    continue
+
+                # plot
                 self.ax.plot(
-                    self.df[list(self.df.keys())[0]],
-                    self.df[list(self.df.keys())[1]],
-                    "o-",
+                    df[list(df.keys())[0]],
+                    df[list(df.keys())[1]],
+                    fmt,
                     linewidth=self.config["linewidth"],
                     label=f"Curve {count+1}",
                 )
+                self.ax.legend()
+                count += 1
 
-            elif self.config["linetype"] == "dashed":
-                self.ax.plot(
-                    self.df[list(self.df.keys())[0]],
-                    self.df[list(self.df.keys())[1]],
-                    "--",
-                    linewidth=self.config["linewidth"],
-                    label=f"Curve {count+1}",
+        self.set_labels()
+        self.fig.tight_layout()
+
+    def set_labels(self):
+        # Column names of the last curve
+        for df in self.dfs.values():
+            if df is not None:
+                self.df = df
+        if self.df is not None:
+            self.ax.set_xlabel(list(self.df.keys())[0])
+            self.ax.set_ylabel(list(self.df.keys())[1], labelpad=0)
+
+    def clear(self):
+        if self.colorbar is not None:
+            self.colorbar.remove()
+            self.colorbar = None
+        self.ax.clear()
+        self.overlay = None
+        self.fit_lines = {}
+
+    def add_trace(self, file, df):
+        if df is None:
+            return
+        # Each curve is decimated to a min/max envelope of the view
+        source = ArraySource(df[list(df.keys())[0]], df[list(df.keys())[1]])
+        self.overlay.add(file, source, self.color_value(df))
+
+    def remove_trace(self, file):
+        self.overlay.remove(file)
+        line = self.fit_lines.pop(file, None)
+        if line is not None:
+            line.remove()
+
+    def color_value(self, df):
+        """Value of the color_by metadata, None if missing or not a number"""
+        try:
+            return float(df.attrs[self.config["color_by"]])
+        except (KeyError, TypeError, ValueError):
+            return
+
+    def update_legend(self):
+        """Legend of the overlay, or a colorbar when colored by metadata"""
+        if self.config["color_by"]:
+            if self.colorbar is None:
+                self.colorbar = self.fig.colorbar(
+                    self.overlay.collection, ax=self.ax, label=self.config["color_by"]
                 )
-            else:
-                self.ax.plot(
-                    self.df[list(self.df.keys())[0]],
-                    self.df[list(self.df.keys())[1]],
+            return
+
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        keys = self.overlay.keys()
+        if 0 < len(keys) <= LEGEND_MAX_TRACES:
+            handles = [
+                Line2D(
+                    [],
+                    [],
+                    color=self.overlay.colors[key],
+                    linestyle="--" if self.config["linetype"] == "dashed" else "-",
                     linewidth=self.config["linewidth"],
-                    label=f"Curve {count+1}",
                 )
+                for key in keys
+            ]
+            self.ax.legend(handles, [f"Curve {i+1}" for i in range(len(keys))])
 
-            self.ax.set_xlabel(list(self.df.keys())[0])
-            self.ax.set_ylabel(list(self.df.keys())[1], labelpad=0)
-            self.ax.legend()
-            count += 1
+    def fit_all(self, func_name, width_ratio=None):
+        """
+        Fit all plotted curves. Curves on the same x grid are fitted at once
+        with fit_stacked, otherwise one by one with fit_curve.
+        """
+        dfs = {file: df for file, df in self.dfs.items() if df is not None}
+        if func_name not in FIT_FUNCTIONS or not dfs:
+            return
 
-        self.fig.tight_layout()
+        files = list(dfs.keys())
+        xs = [
+            np.asarray(df[list(df.keys())[0]], dtype=np.float64) for df in dfs.values()
+        ]
+        ys = [
+            np.asarray(df[list(df.keys())[1]], dtype=np.float64) for df in dfs.values()
+        ]
+
+        if all(len(x) == len(xs[0]) and np.array_equal(x, xs[0]) for x in xs):
+            para, cov, converged = fit_stacked(
+                xs[0], np.stack(ys), func_name, width_ratio
+            )
+        else:
+            para, cov, converged = [], [], []
+            for x, y in zip(xs, ys):
+                result = fit_curve(x, y, func_name, width_ratio)
+                converged.append(result is not None)
+                para.append(
+                    result[0]
+                    if result is not None
+                    else np.full(len(FIT_PARAMETERS[func_name]), np.nan)
+                )
+                cov.append(result[1] if result is not None else None)
+
+        # Plot fitting curves, replacing previous fits of the same files
+        func = FIT_FUNCTIONS[func_name]
+        for file, x, p, ok in zip(files, xs, para, converged):
+            line = self.fit_lines.pop(file, None)
+            if line is not None:
+                line.remove()
+            if ok:
+                new_x = np.linspace(np.min(x), np.max(x), 1000)
+                (self.fit_lines[file],) = self.ax.plot(
+                    new_x, func(new_x, *p), "--", linewidth=self.config["linewidth"]
+                )
+
+        results = pd.DataFrame(np.asarray(para), columns=FIT_PARAMETERS[func_name])
+        results.insert(0, "file", files)
+        results.insert(1, "converged", converged)
+        results["covariance"] = list(cov)
+        return results
 
     def save_fig(self, export_path=None):
         """
@@ -100,19 +253,13 @@ class PlotControl:
     def show_meta(self, filename=None, config=None):
         # Update data when file name is set
         if filename is not None:
-            # Read file data
+            # Plotted DataFrame, otherwise read file data (shared cache)
             self.filepath = filename
-            if self.filepath.endswith(".pickle"):
-                self.df = pd.read_pickle(self.filepath)
-                # Return the file data to main
-                return self.df
-
-            elif self.filepath.endswith(".h5"):
-                # Read DataFrame and retrieve attributes
-                with pd.HDFStore(self.filepath) as store:
-                    self.df = store["df"]  # Load the DataFrame
-                    self.df.attrs = store.get_storer("df").attrs.metadata
-                return self.df
+            self.df = self.dfs.get(filename)
+            if self.df is None:
+                self.df = load_dataframe(self.filepath)
+            # Return the file data to main
+            return self.df
 
         if self.df is None:
             return
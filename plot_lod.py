@@ -0,0 +1,372 @@
+import os
+
+import numpy as np
+from matplotlib import colormaps, rcParams
+from matplotlib.collections import LineCollection
+
+from data_io import open_store
+
+# HDF5 group holding the min/max pyramid of the trace
+PYRAMID_KEY = "pyramid"
+
+
+def envelope_index(y, bin_size):
+    """
+    Indices of the minimum and maximum of y in each bin of bin_size samples.
+    Keeping both extremes preserves narrow peaks and dips after decimation.
+    """
+    n = len(y)
+    n_full = n // bin_size
+
+    # Extremes of the bins with full length
+    blocks = y[: n_full * bin_size].reshape(n_full, bin_size)
+    start = np.arange(n_full) * bin_size
+    i_min = start + np.argmin(blocks, axis=1)
+    i_max = start + np.argmax(blocks, axis=1)
+
+    # Remaining samples form the last bin
+    if n_full * bin_size < n:
+        tail = y[n_full * bin_size :]
+        i_min = np.append(i_min, n_full * bin_size + np.argmin(tail))
+        i_max = np.append(i_max, n_full * bin_size + np.argmax(tail))
+
+    # Keep the original order of the two points in each bin
+    return np.stack(
+        [np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1
+    ).ravel()
+
+
+def minmax_envelope(x, y, n_bins):
+    """Decimate (x, y) to a min/max envelope with n_bins bins"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= 2 * n_bins:
+        return x, y
+
+    index = envelope_index(y, int(np.ceil(len(y) / n_bins)))
+    return x[index], y[index]
+
+
+def build_pyramid(filename, factor=4, min_bins=1024):
+    """
+    Write a min/max pyramid of the trace in the .h5 file.
+    Level k stores two points per bin of factor**k samples under pyramid/level_k,
+    so that a view of any size can be drawn from a few thousand points.
+    """
+    import pandas as pd
+
+    with open_store(filename, mode="a") as store:
+        df = store["df"]
+        columns = list(df.keys())[:2]
+        x = np.ascontiguousarray(df[columns[0]], dtype=np.float64)
+        y = np.ascontiguousarray(df[columns[1]], dtype=np.float64)
+        length = len(y)
+
+        # Remove levels of an older pyramid
+        for key in store.keys():
+            if key.startswith(f"/{PYRAMID_KEY}/"):
+                store.remove(key)
+
+        level = 0
+        while length / factor ** (level + 1) >= min_bins:
+            # Level k is computed from level k-1: each new bin has 2*factor points
+            bin_size = factor if level == 0 else 2 * factor
+            index = envelope_index(y, bin_size)
+            x, y = x[index], y[index]
+            level += 1
+            store.put(
+                f"{PYRAMID_KEY}/level_{level}",
+                pd.DataFrame({columns[0]: x, columns[1]: y}),
+            )
+
+        store.get_storer("df").attrs.pyramid = {
+            "factor": factor,
+            "levels": level,
+            "length": length,
+        }
+
+    return level
+
+
+def open_pyramid(filename, low=0, up=None):
+    """PyramidSource of the file if it has a valid pyramid, otherwise None"""
+    if not filename.endswith(".h5"):
+        return
+
+    with open_store(filename) as store:
+        storer = store.get_storer("df")
+        info = getattr(storer.attrs, "pyramid", None)
+        # Pyramid is dropped when df is rewritten, check the length anyway
+        length = storer.nrows if storer.is_table else storer.shape[0]
+        if not info or info["levels"] == 0 or info["length"] != length:
+            return
+
+    return PyramidSource(filename, info, low, up)
+
+
+def axes_bins(ax):
+    """One bin per pixel column of the axes"""
+    return max(int(ax.bbox.width), 100)
+
+
+class ArraySource:
+    """Full resolution data in memory"""
+
+    def __init__(self, x, y, decimate=True) -> None:
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.decimate = decimate
+        # Visible range can be found by bisection only for sorted x
+        self.is_sorted = bool(np.all(self.x[1:] >= self.x[:-1]))
+
+    def view(self, xmin=None, xmax=None, n_bins=1000):
+        """Envelope of the data between xmin and xmax"""
+        if not self.decimate:
+            return self.x, self.y
+
+        low, up = 0, len(self.x)
+        if self.is_sorted and xmin is not None and xmax is not None:
+            # One extra point on each side so that the line reaches the edges
+            low = max(np.searchsorted(self.x, xmin, side="left") - 1, 0)
+            up = min(np.searchsorted(self.x, xmax, side="right") + 1, len(self.x))
+        return minmax_envelope(self.x[low:up], self.y[low:up], n_bins)
+
+
+class EnvelopeLine:
+    """
+    Line2D showing the envelope of a source at the pixel resolution of the axes.
+    The envelope is recomputed when the x range changes, e.g. zoom/pan with
+    NavigationToolbar2Tk, so zooming in reveals the full resolution data.
+    """
+
+    def __init__(self, ax, source, fmt="-", **kwargs) -> None:
+        self.ax = ax
+        self.source = source
+        (self.line,) = ax.plot([], [], fmt, **kwargs)
+        self.autoscaling = False
+        self.cid = ax.callbacks.connect("xlim_changed", self.on_xlim_changed)
+        self.refresh(autoscale=True)
+
+    def n_bins(self):
+        return axes_bins(self.ax)
+
+    def refresh(self, autoscale=False):
+        if autoscale:
+            x, y = self.source.view(n_bins=self.n_bins())
+            self.line.set_data(x, y)
+            # The whole data is already shown, skip the xlim_changed refresh
+            self.autoscaling = True
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.autoscaling = False
+        else:
+            xmin, xmax = sorted(self.ax.get_xlim())
+            x, y = self.source.view(xmin, xmax, n_bins=self.n_bins())
+            self.line.set_data(x, y)
+
+    def set_source(self, source):
+        self.source = source
+        self.refresh(autoscale=True)
+
+    def on_xlim_changed(self, ax):
+        if not self.autoscaling:
+            self.refresh()
+
+    def remove(self):
+        self.ax.callbacks.disconnect(self.cid)
+        self.line.remove()
+
+
+class EnvelopeCollection:
+    """
+    One LineCollection showing the envelopes of many sources, e.g. an overlay
+    of a sweep. Traces are added and removed by key without redrawing the others.
+    Colors follow the value of each trace through cmap if given, otherwise the
+    color cycle; the color of a trace does not change when others are removed.
+    """
+
+    def __init__(self, ax, cmap=None, **kwargs) -> None:
+        self.ax = ax
+        # key -> source, value for the colormap and color of the cycle
+        self.sources = {}
+        self.values = {}
+        self.colors = {}
+        self.n_added = 0
+        # Segments of the traces for the current view
+        self.segments = {}
+        self.view = None
+
+        self.collection = LineCollection([], **kwargs)
+        if cmap is not None:
+            # Traces without a value are drawn in gray
+            self.collection.set_cmap(colormaps[cmap].with_extremes(bad="gray"))
+        self.use_cmap = cmap is not None
+        ax.add_collection(self.collection, autolim=False)
+
+        self.autoscaling = False
+        self.cid = ax.callbacks.connect("xlim_changed", self.on_xlim_changed)
+
+    def n_bins(self):
+        return axes_bins(self.ax)
+
+    def add(self, key, source, value=None):
+        """Add a trace, shown at the next refresh()"""
+        colors = rcParams["axes.prop_cycle"].by_key().get("color", ["C0"])
+        self.sources[key] = source
+        self.values[key] = value
+        self.colors[key] = colors[self.n_added % len(colors)]
+        self.n_added += 1
+
+    def remove(self, key):
+        """Remove a trace, hidden at the next refresh()"""
+        self.sources.pop(key, None)
+        self.values.pop(key, None)
+        self.colors.pop(key, None)
+        self.segments.pop(key, None)
+
+    def keys(self):
+        return list(self.sources.keys())
+
+    def refresh(self, autoscale=False):
+        n_bins = self.n_bins()
+        if autoscale:
+            view = (None, None, n_bins)
+        else:
+            xmin, xmax = sorted(self.ax.get_xlim())
+            view = (xmin, xmax, n_bins)
+
+        # Only traces added since the last refresh are decimated for an unchanged view
+        if view != self.view:
+            self.view = view
+            self.segments = {}
+        for key, source in self.sources.items():
+            if key not in self.segments:
+                x, y = source.view(*view)
+                self.segments[key] = np.column_stack([x, y])
+
+        keys = self.keys()
+        self.collection.set_segments([self.segments[key] for key in keys])
+        if self.use_cmap:
+            values = np.array(
+                [
+                    np.nan if self.values[key] is None else self.values[key]
+                    for key in keys
+                ],
+                dtype=np.float64,
+            )
+            self.collection.set_array(np.ma.masked_invalid(values))
+            if np.isfinite(values).any():
+                self.collection.set_clim(np.nanmin(values), np.nanmax(values))
+        else:
+            self.collection.set_color([self.colors[key] for key in keys])
+
+        if autoscale:
+            # The whole data is already shown, skip the xlim_changed refresh
+            self.autoscaling = True
+            self.ax.relim()
+            for segment in self.segments.values():
+                if len(segment):
+                    self.ax.update_datalim([segment.min(axis=0), segment.max(axis=0)])
+            self.ax.autoscale_view()
+            self.autoscaling = False
+
+    def on_xlim_changed(self, ax):
+        if not self.autoscaling:
+            self.refresh()
+
+    def clear(self):
+        self.ax.callbacks.disconnect(self.cid)
+        self.collection.remove()
+
+
+class PyramidSource:
+    """
+    Trace stored with a min/max pyramid in .h5 file.
+    Only the coarsest level is kept in memory; finer levels and the raw data
+    are read by row range when the view needs them.
+    """
+
+    def __init__(self, filename, info, low=0, up=None) -> None:
+        self.filename = filename
+        self.factor = info["factor"]
+        self.levels = info["levels"]
+        self.length = info["length"]
+        # Range of raw samples to show
+        self.low = low
+        self.up = self.length if up is None else up
+
+        with open_store(self.filename) as store:
+            coarse = store[f"{PYRAMID_KEY}/level_{self.levels}"]
+            # x range of the selected samples
+            first = store.select("df", start=self.low, stop=self.low + 1)
+            last = store.select("df", start=self.up - 1, stop=self.up)
+        self.columns = list(first.keys())[:2]
+        self.coarse_x = np.ascontiguousarray(coarse[self.columns[0]], dtype=np.float64)
+        self.coarse_y = np.ascontiguousarray(coarse[self.columns[1]], dtype=np.float64)
+        self.x_range = (first[self.columns[0]].iloc[0], last[self.columns[0]].iloc[0])
+
+    def bin_size(self, level):
+        return self.factor**level
+
+    def raw_range(self, xmin=None, xmax=None):
+        """Range of raw samples covering [xmin, xmax], located on the coarsest level"""
+        low, up = self.low, self.up
+        if xmin is not None and xmax is not None:
+            bin_size = self.bin_size(self.levels)
+            first = np.searchsorted(self.coarse_x, xmin, side="left") // 2 - 1
+            last = np.searchsorted(self.coarse_x, xmax, side="right") // 2 + 1
+            low = max(low, first * bin_size)
+            up = min(up, (last + 1) * bin_size)
+        return low, max(low, up)
+
+    def view(self, xmin=None, xmax=None, n_bins=1000):
+        """Envelope between xmin and xmax read from the coarsest sufficient level"""
+        low, up = self.raw_range(xmin, xmax)
+
+        # Coarsest level that still has n_bins bins in the range
+        level = 0
+        while level < self.levels and (up - low) / self.bin_size(level + 1) >= n_bins:
+            level += 1
+
+        if level == self.levels and low == self.low and up == self.up:
+            x, y = self.coarse_x, self.coarse_y
+        elif level == 0:
+            with open_store(self.filename) as store:
+                df = store.select("df", start=low, stop=up)
+            return minmax_envelope(df[self.columns[0]], df[self.columns[1]], n_bins)
+        else:
+            bin_size = self.bin_size(level)
+            with open_store(self.filename) as store:
+                df = store.select(
+                    f"{PYRAMID_KEY}/level_{level}",
+                    start=2 * (low // bin_size),
+                    stop=2 * -(-up // bin_size),
+                )
+            x = np.asarray(df[self.columns[0]], dtype=np.float64)
+            y = np.asarray(df[self.columns[1]], dtype=np.float64)
+
+        # Bins at the edges may contain samples outside the selected range
+        mask = (x >= self.x_range[0]) & (x <= self.x_range[1])
+        return x[mask], y[mask]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Write min/max pyramid into .h5 files for fast plotting"
+    )
+    parser.add_argument("path", nargs="+", help=".h5 files or folders")
+    parser.add_argument("--factor", type=int, default=4)
+    parser.add_argument("--min-bins", type=int, default=1024)
+    args = parser.parse_args()
+
+    for path in args.path:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            files = [path]
+        for file in files:
+            if file.endswith(".h5"):
+                levels = build_pyramid(file, args.factor, args.min_bins)
+                print(f"{file}: {levels} levels")
@@ -0,0 +1,63 @@
+import os
+import threading
+
+from data_cache import shared_cache
+from data_io import read_chunked
+
+
+class Prefetcher:
+    """
+    Load the files next to the one being shown into the cache on a worker thread,
+    so that stepping through a sweep does not wait for the files to be read.
+    Only the newest request matters, files of an older request are skipped.
+    Files larger than a share of the cache budget are not prefetched, so that
+    the neighbours never evict the file being shown.
+    """
+
+    def __init__(self, cache=shared_cache, depth=1) -> None:
+        self.cache = cache
+        # Number of files prefetched on each side
+        self.depth = depth
+        # Files still to be loaded, nearest first
+        self.wanted = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+    def request(self, filenames):
+        """Load the files in order, replacing the files of the previous request"""
+        with self.condition:
+            self.wanted = list(filenames)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def max_bytes(self):
+        # The shown file and its neighbours on both sides have to fit in the cache
+        return self.cache.budget // (2 * self.depth + 1)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.wanted and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                filename = self.wanted.pop(0)
+
+            try:
+                if os.path.getsize(filename) > self.max_bytes():
+                    continue
+                if self.cache.get(filename) is None:
+                    # Reading of the file being shown goes first
+                    self.cache.load(filename, read=read_chunked)
+            except Exception:
+                # Removed or partially written file, it is read again when selected
+                pass
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.wanted = []
+            self.condition.notify()